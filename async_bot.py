@@ -0,0 +1,346 @@
+# async_bot.py
+"""Асинхронный режим бота на AsyncTeleBot (python main.py --async).
+
+Обработчики повторяют обработчики из bot.py и используют ту же логику:
+запросы к базе выполняются через db.run_in_db в отдельном пуле потоков, а
+вызовы Telegram API ожидаются в цикле событий. Поэтому медленный запрос
+к Telegram или запись в SQLite не задерживают обработку других чатов.
+
+Уведомления участникам групп по-прежнему доставляются через outbox и
+notifier из bot.py.
+"""
+
+import logging
+
+from telebot import asyncio_filters, asyncio_helper, types
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_handler_backends import BaseMiddleware, CancelUpdate
+
+from bot import (
+    ABOUT_APP,
+    ABOUT_MESSAGE,
+    ADD_FAILED_MESSAGE,
+    CANCELLED_MESSAGE,
+    CLEAR_BUTTONS,
+    CLEAR_LIST,
+    CLEAR_PROMPT,
+    EMPTY_ITEM_MESSAGE,
+    ITEM_NOT_FOUND_MESSAGE,
+    JOIN_LIST,
+    JOIN_PROMPT,
+    JOIN_REPLIES,
+    LAST_PAGE,
+    MENU_PROMPT,
+    NOTHING_TO_REPEAT_MESSAGE,
+    SHARE_LIST,
+    SHARE_MESSAGE,
+    SHOPPING_LIST,
+    VIEW_SHARED_USERS,
+    States,
+    add_history_item,
+    add_items,
+    add_recent_items,
+    allow_update,
+    chat_menu,
+    clear_group_list,
+    generate_share_code,
+    join_group,
+    load_add_suggestions,
+    load_list_view,
+    main_menu,
+    parse_items,
+    parse_page,
+    register_user,
+    remove_item,
+    render_add_prompt,
+    render_added,
+    render_deleted,
+    render_members,
+    render_welcome,
+    save_live_message,
+    state_storage,
+)
+from config import API_TOKEN
+import metrics
+from db import run_in_db
+from router import Router
+from settings import TELEGRAM_API_URL
+from state_storage import AsyncSQLiteStateStorage
+
+logger = logging.getLogger(__name__)
+
+# Инициализация бота. Состояния общие с синхронным режимом
+if TELEGRAM_API_URL:
+    asyncio_helper.API_URL = TELEGRAM_API_URL
+bot = AsyncTeleBot(API_TOKEN, state_storage=AsyncSQLiteStateStorage(state_storage))
+metrics.instrument_async_bot_api()
+bot.add_custom_filter(asyncio_filters.StateFilter(bot))
+
+
+# Ограничение частоты обновлений, общее с синхронным режимом (bot.allow_update)
+class FloodControlMiddleware(BaseMiddleware):
+    update_types = ["message", "callback_query"]
+
+    async def pre_process(self, update, data):
+        if not allow_update(update):
+            return CancelUpdate()
+
+    async def post_process(self, update, data, exception):
+        pass
+
+
+bot.setup_middleware(FloodControlMiddleware())
+
+
+# Функция для отправки сообщений с Markdown и главным меню
+async def send_markdown_message(chat_id, text, reply_markup=None):
+    if reply_markup is None:
+        reply_markup = await run_in_db(chat_menu, chat_id)
+    return await bot.send_message(
+        chat_id,
+        text,
+        reply_markup=reply_markup,
+        parse_mode="Markdown",
+    )
+
+
+# Редактирование ранее отправленного сообщения с Markdown
+async def edit_markdown_message(chat_id, message_id, text, reply_markup=None):
+    """Возвращает False, если сообщение удалено или его нельзя отредактировать."""
+    try:
+        await bot.edit_message_text(
+            text,
+            chat_id=chat_id,
+            message_id=message_id,
+            reply_markup=reply_markup,
+            parse_mode="Markdown",
+        )
+    except asyncio_helper.ApiTelegramException as e:
+        if "message is not modified" in e.description:
+            return True
+        if e.error_code == 400:
+            return False
+        raise
+    return True
+
+
+# Удаление сообщения, которое могло уже исчезнуть
+async def delete_message_quietly(chat_id, message_id):
+    try:
+        await bot.delete_message(chat_id, message_id)
+    except asyncio_helper.ApiTelegramException as e:
+        logger.info(f"Не удалось удалить сообщение {message_id}: {e.description}")
+
+
+# Ответ на запрос кода приглашения (регистрируется раньше остальных)
+@bot.message_handler(state=States.JOIN_CODE)
+@metrics.timed_handler
+async def handle_join_code(message):
+    await bot.delete_state(message.from_user.id, message.chat.id)
+    joined = await run_in_db(join_group, message.from_user, message.text.strip())
+    await send_markdown_message(message.chat.id, JOIN_REPLIES[joined])
+
+
+# Обработчик команды /start
+@bot.message_handler(commands=["start"])
+@metrics.timed_handler
+async def start(message):
+    await run_in_db(register_user, message.from_user)
+    await send_markdown_message(message.chat.id, render_welcome(message.from_user))
+
+
+# Остальные сообщения и нажатия на кнопки распределяет таблица маршрутов
+router = Router()
+
+
+@bot.message_handler(func=lambda message: True)
+async def route_message(message):
+    handler = router.message_route(message)
+    if handler is not None:
+        with metrics.HANDLER_SECONDS.time(handler.__name__):
+            await handler(message)
+
+
+@bot.callback_query_handler(func=lambda call: True)
+async def route_callback(call):
+    handler, payload = router.callback_route(call)
+    if handler is not None:
+        with metrics.HANDLER_SECONDS.time(handler.__name__):
+            await handler(call, payload)
+
+
+# Создание кода для совместного списка
+@router.text(SHARE_LIST)
+async def share_list(message):
+    share_code = await run_in_db(generate_share_code, message.from_user.id)
+    await send_markdown_message(
+        message.chat.id, SHARE_MESSAGE.format(share_code=share_code)
+    )
+
+
+# Запрос кода для присоединения к списку
+@router.text(JOIN_LIST)
+async def join_list(message):
+    await send_markdown_message(
+        message.chat.id, JOIN_PROMPT, reply_markup=types.ReplyKeyboardRemove()
+    )
+    await bot.set_state(message.from_user.id, States.JOIN_CODE, message.chat.id)
+
+
+# Вопрос о добавлении товаров из сообщения
+@router.default
+async def ask_to_add(message):
+    items, skipped = parse_items(message.text)
+    if not items:
+        await send_markdown_message(message.chat.id, EMPTY_ITEM_MESSAGE)
+        return
+    user_id = message.from_user.id
+    await bot.set_state(user_id, States.ADD_ITEM, message.chat.id)
+    async with bot.retrieve_data(user_id, message.chat.id) as data:
+        data["items"] = items
+    suggestions, recent = await run_in_db(load_add_suggestions, user_id, items)
+    text, markup = render_add_prompt(items, suggestions, len(recent), skipped)
+    await send_markdown_message(message.chat.id, text, reply_markup=markup)
+
+
+# Подтверждение добавления товаров
+@router.action("add")
+async def handle_add_item(call, payload):
+    user_id = call.from_user.id
+    async with bot.retrieve_data(user_id, call.message.chat.id) as data:
+        items = data.get("items")
+    if not items:
+        await bot.answer_callback_query(call.id, ADD_FAILED_MESSAGE)
+        return
+
+    await run_in_db(add_items, call.from_user, items)
+    await bot.delete_state(user_id, call.message.chat.id)
+    await bot.answer_callback_query(call.id, render_added(items))
+    await show_list(call.message, user_id, edit=True, page=LAST_PAGE)
+
+
+# Добавление подсказки из истории
+@router.action("hist")
+async def handle_history_item(call, history_id):
+    user_id = call.from_user.id
+    item = await run_in_db(add_history_item, call.from_user, history_id)
+    if not item:
+        await bot.answer_callback_query(call.id, ITEM_NOT_FOUND_MESSAGE)
+        return
+
+    await bot.delete_state(user_id, call.message.chat.id)
+    await bot.answer_callback_query(call.id, render_added([item]))
+    await show_list(call.message, user_id, edit=True, page=LAST_PAGE)
+
+
+# Возврат товаров за последнюю неделю
+@router.action("repeat")
+async def handle_repeat(call, payload):
+    user_id = call.from_user.id
+    items = await run_in_db(add_recent_items, call.from_user)
+    if not items:
+        await bot.answer_callback_query(call.id, NOTHING_TO_REPEAT_MESSAGE)
+        return
+
+    await bot.delete_state(user_id, call.message.chat.id)
+    await bot.answer_callback_query(call.id, render_added(items))
+    await show_list(call.message, user_id, edit=True, page=LAST_PAGE)
+
+
+# Удаление товара из списка
+@router.action("delete")
+async def delete_item(call, item_id):
+    item = await run_in_db(remove_item, call.from_user, item_id)
+    if not item:
+        await bot.answer_callback_query(call.id, ITEM_NOT_FOUND_MESSAGE)
+        return
+
+    await bot.answer_callback_query(call.id, render_deleted(item))
+    await show_list(call.message, call.from_user.id, edit=True, page=None)
+
+
+# Отображение списка покупок (см. bot.show_list)
+@router.text(SHOPPING_LIST)
+async def show_list(message, user_id=None, edit=False, page=0):
+    if user_id is None:
+        user_id = message.from_user.id
+    chat_id = message.chat.id
+    live, rendered = await run_in_db(load_list_view, chat_id, user_id, page)
+    live_id, menu_has_items, live_page = live
+    text, markup, has_items, page = rendered
+
+    message_id = None
+    if edit and await edit_markdown_message(chat_id, message.message_id, text, markup):
+        message_id = message.message_id
+    if message_id is None:
+        sent = await send_markdown_message(chat_id, text, reply_markup=markup)
+        message_id = sent.message_id
+    if live_id and live_id != message_id:
+        await delete_message_quietly(chat_id, live_id)
+
+    if menu_has_items is None or bool(menu_has_items) != has_items:
+        await send_markdown_message(
+            chat_id, MENU_PROMPT, reply_markup=main_menu(has_items=has_items)
+        )
+    if (live_id, menu_has_items, live_page) != (message_id, has_items, page):
+        await run_in_db(save_live_message, chat_id, message_id, has_items, page)
+
+
+# Листание страниц списка
+@router.action("page")
+async def change_page(call, page):
+    page = parse_page(page)
+    if page is None:
+        await bot.answer_callback_query(call.id, ITEM_NOT_FOUND_MESSAGE)
+        return
+    await bot.answer_callback_query(call.id)
+    await show_list(call.message, call.from_user.id, edit=True, page=page)
+
+
+# Подтверждение очистки списка
+@router.text(CLEAR_LIST)
+async def confirm_clear_list(message):
+    markup = types.InlineKeyboardMarkup()
+    for button_text, callback_data in CLEAR_BUTTONS:
+        markup.add(types.InlineKeyboardButton(button_text, callback_data=callback_data))
+    await send_markdown_message(message.chat.id, CLEAR_PROMPT, reply_markup=markup)
+
+
+@router.action("clear")
+async def clear_list(call, payload):
+    await run_in_db(clear_group_list, call.from_user)
+    await bot.answer_callback_query(call.id, "🗑️ Список очищен.")
+    await show_list(call.message, call.from_user.id, edit=True)
+
+
+# Универсальный обработчик отмены действия
+async def handle_cancel_action(call):
+    await bot.answer_callback_query(call.id, "🔙 Действие отменено.")
+    await send_markdown_message(call.message.chat.id, CANCELLED_MESSAGE)
+
+
+@router.action("cancel")
+async def cancel_action(call, payload):
+    await bot.delete_state(call.from_user.id, call.message.chat.id)
+    await handle_cancel_action(call)
+
+
+# Информация о приложении
+@router.text(ABOUT_APP)
+async def about_app(message):
+    await send_markdown_message(message.chat.id, ABOUT_MESSAGE)
+
+
+# Показ участников списка
+@router.text(VIEW_SHARED_USERS)
+async def show_shared_users(message):
+    text = await run_in_db(render_members, message.from_user.id)
+    await send_markdown_message(message.chat.id, text)
+
+
+# Запуск long polling в цикле событий
+async def run():
+    try:
+        await bot.infinity_polling()
+    finally:
+        await bot.close_session()
@@ -0,0 +1,262 @@
+# backup.py
+"""Резервные копии базы без остановки бота и перенос данных в JSON Lines.
+
+Копия снимается онлайн-API резервного копирования SQLite порциями по
+BACKUP_PAGES страниц. Запись в базу при этом не останавливается благодаря
+режиму WAL: копирование только читает базу, а чтение писателей не
+блокирует. Если бот пишет так часто, что копирование то и дело начинается
+заново, остаток копируется одним шагом. Копия пишется во временный файл и подменяет
+целевой только после успешного завершения.
+
+Экспорт выгружает пользователей, группы, членство, списки и историю покупок
+построчно из одного снимка базы, импорт загружает их порциями; память не
+зависит от размера базы.
+
+Запуск:
+    python backup.py backup shopbot-backup.db
+    python backup.py export shopbot.jsonl.gz
+    python backup.py import shopbot.jsonl.gz
+"""
+
+import argparse
+import glob
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+
+from config import DB_NAME
+from db import execute_many, execute_query, transaction
+from migrations import current_version, migrate
+from periodic import PeriodicTask
+from settings import (
+    BACKUP_DIR,
+    BACKUP_INTERVAL,
+    BACKUP_KEEP,
+    BACKUP_MAX_RESTARTS,
+    BACKUP_PAGES,
+    DB_BUSY_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMAT = "shopbot-export"
+EXPORT_VERSION = 1
+# Таблицы в порядке выгрузки: сначала те, на которые ссылаются остальные
+EXPORT_TABLES = ("users", "groups", "user_groups", "lists", "item_history")
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+# Онлайн-копия базы данных
+def backup(target, pages=BACKUP_PAGES, max_restarts=BACKUP_MAX_RESTARTS):
+    """Копирует базу в файл target. Возвращает статистику копирования."""
+    started = time.perf_counter()
+    temporary = f"{target}.tmp"
+    if os.path.exists(temporary):
+        os.remove(temporary)
+    progress = {"steps": 0, "restarts": 0, "remaining": None, "total": 0}
+
+    def on_progress(status, remaining, total):
+        # Остаток вырос - копирование началось заново после записи в базу
+        if progress["remaining"] is not None and remaining > progress["remaining"]:
+            progress["restarts"] += 1
+            if progress["restarts"] > max_restarts:
+                raise _TooManyRestarts()
+        progress.update(steps=progress["steps"] + 1, remaining=remaining, total=total)
+
+    source = sqlite3.connect(DB_NAME, timeout=DB_BUSY_TIMEOUT)
+    destination = sqlite3.connect(temporary)
+    try:
+        try:
+            source.backup(destination, pages=pages, progress=on_progress)
+        except _TooManyRestarts:
+            logger.info("База часто меняется, остаток копируется одним шагом")
+            source.backup(destination, pages=-1)
+    finally:
+        destination.close()
+        source.close()
+    os.replace(temporary, target)
+    stats = {
+        "target": target,
+        "pages": progress["total"],
+        "steps": progress["steps"],
+        "restarts": progress["restarts"],
+        "size_kb": round(os.path.getsize(target) / 1024, 1),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    logger.info(f"Резервная копия создана: {stats}")
+    return stats
+
+
+# Периодическая копия в BACKUP_DIR с хранением BACKUP_KEEP последних
+def scheduled_backup(directory=BACKUP_DIR, keep=BACKUP_KEEP):
+    # При keep = 0 срез [:-0] пуст и старые копии не удалялись бы никогда
+    if keep < 1:
+        raise ValueError(f"BACKUP_KEEP должен быть не меньше 1, а не {keep}")
+    os.makedirs(directory, exist_ok=True)
+    name = f"shopbot-{time.strftime('%Y%m%d-%H%M%S')}.db"
+    stats = backup(os.path.join(directory, name))
+    # Имена упорядочены по времени создания
+    for old in sorted(glob.glob(os.path.join(directory, "shopbot-*.db")))[:-keep]:
+        os.remove(old)
+    return stats
+
+
+# Неверную настройку показываем при запуске, а не через BACKUP_INTERVAL секунд
+if BACKUP_DIR and BACKUP_KEEP < 1:
+    raise ValueError(f"BACKUP_KEEP должен быть не меньше 1, а не {BACKUP_KEEP}")
+backup_task = PeriodicTask(
+    "backup", scheduled_backup, BACKUP_INTERVAL if BACKUP_DIR else None
+)
+
+
+def _open(path, mode):
+    """Файл JSON Lines: "-" - стандартный поток, *.gz - сжатый gzip."""
+    if path == "-":
+        return sys.stdout if mode == "w" else sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+# Выгрузка данных в JSON Lines
+def export_jsonl(path):
+    """Пишет заголовок и по строке на каждую запись таблиц EXPORT_TABLES.
+
+    Все таблицы читаются в одной транзакции чтения, поэтому выгрузка
+    согласована, даже если бот в это время работает. Возвращает
+    {таблица: число строк}.
+    """
+    counts = {}
+    conn = sqlite3.connect(DB_NAME, timeout=DB_BUSY_TIMEOUT, isolation_level=None)
+    out = _open(path, "w")
+    try:
+        conn.execute("BEGIN")
+        schema_version = conn.execute(
+            "SELECT COALESCE(MAX(version), 0) FROM schema_version"
+        ).fetchone()[0]
+        header = {
+            "format": EXPORT_FORMAT,
+            "version": EXPORT_VERSION,
+            "schema_version": schema_version,
+        }
+        out.write(json.dumps(header) + "\n")
+        for table in EXPORT_TABLES:
+            cursor = conn.execute(f"SELECT * FROM {table}")
+            columns = [column[0] for column in cursor.description]
+            counts[table] = 0
+            for row in cursor:
+                record = {"table": table, "row": dict(zip(columns, row))}
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                counts[table] += 1
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+        if out is not sys.stdout:
+            out.close()
+    return counts
+
+
+# Загрузка данных из JSON Lines
+def import_jsonl(path, batch=1000):
+    """Добавляет записи выгрузки в базу порциями по batch строк.
+
+    Рассчитан на загрузку в новую базу: идентификаторы групп сохраняются.
+    Записи с уже существующим ключом пропускаются, поэтому прерванный
+    импорт можно просто запустить еще раз. Возвращает
+    {таблица: (добавлено, пропущено)}.
+    """
+    columns = {
+        table: {
+            row[1] for row in execute_query(f"PRAGMA table_info({table})", fetch=True)
+        }
+        for table in EXPORT_TABLES
+    }
+    counts = {table: [0, 0] for table in EXPORT_TABLES}
+    pending_table, pending = None, []
+
+    def flush():
+        if not pending:
+            return
+        names = list(pending[0])
+        # Все строки порции должны иметь одинаковый набор столбцов
+        query = (
+            f"INSERT OR IGNORE INTO {pending_table} ({', '.join(names)}) "
+            f"VALUES ({', '.join('?' * len(names))})"
+        )
+        with transaction():
+            inserted = execute_many(
+                query, [[row[name] for name in names] for row in pending]
+            )
+        counts[pending_table][0] += inserted
+        counts[pending_table][1] += len(pending) - inserted
+        pending.clear()
+
+    source = _open(path, "r")
+    try:
+        header = json.loads(source.readline() or "{}")
+        if header.get("format") != EXPORT_FORMAT:
+            raise ValueError(f"{path}: это не выгрузка {EXPORT_FORMAT}")
+        if header.get("schema_version", 0) > current_version():
+            raise ValueError(
+                f"{path}: выгрузка из более новой схемы "
+                f"({header['schema_version']}), сначала обновите бота"
+            )
+        for line in source:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            table, row = record["table"], record["row"]
+            if table not in columns:
+                raise ValueError(f"{path}: неизвестная таблица {table}")
+            # Столбцы, которых нет в схеме, отбрасываются
+            row = {name: value for name, value in row.items() if name in columns[table]}
+            if (
+                table != pending_table
+                or len(pending) >= batch
+                or (pending and row.keys() != pending[0].keys())
+            ):
+                flush()
+                pending_table = table
+            pending.append(row)
+        flush()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    # Членство изменилось в обход бота: кэши всех процессов нужно сбросить
+    execute_query("UPDATE counters SET value = value + 1 WHERE name = 'membership'")
+    return {table: tuple(value) for table, value in counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Резервные копии ShopBuddy")
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser("backup", help="онлайн-копия файла базы")
+    command.add_argument("target")
+    command.add_argument("--pages", type=int, default=BACKUP_PAGES)
+    command = commands.add_parser("export", help="выгрузка в JSON Lines")
+    command.add_argument("path", help='файл (*.gz - со сжатием) или "-"')
+    command = commands.add_parser("import", help="загрузка из JSON Lines")
+    command.add_argument("path", help='файл (*.gz - со сжатием) или "-"')
+    command.add_argument("--batch", type=int, default=1000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.command == "backup":
+        backup(args.target, pages=args.pages)
+    elif args.command == "export":
+        counts = export_jsonl(args.path)
+        print(counts, file=sys.stderr)
+    else:
+        migrate()
+        print(import_jsonl(args.path, batch=args.batch))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+# benchmarks/fake_bot_api.py
+"""Локальная замена Telegram Bot API для тестов без обращения к Telegram.
+
+Сервер принимает запросы вида /bot<token>/<method>, записывает их и отвечает
+правдоподобными результатами. Он умеет имитировать лимиты Telegram, отвечая
+429 с retry_after при превышении общего лимита или лимита на один чат.
+
+Запуск:
+    python -m benchmarks.fake_bot_api --port 8081 --global-rate 30
+
+Чтобы бот отправлял запросы на этот сервер, добавьте в config.py:
+    TELEGRAM_API_URL = "http://127.0.0.1:8081/bot{0}/{1}"
+"""
+
+import argparse
+import itertools
+import json
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+
+class FakeBotAPI:
+    """Поддельный сервер Bot API, работающий в фоновом потоке."""
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        latency=0.0,
+        global_rate=None,
+        per_chat_interval=None,
+        retry_after=1,
+    ):
+        self.latency = latency
+        self.global_rate = global_rate
+        self.per_chat_interval = per_chat_interval
+        self.retry_after = retry_after
+        self.calls = []
+        self.counts = Counter()
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._message_ids = itertools.count(1)
+        self._recent = deque()
+        self._chat_last = {}
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        """Шаблон адреса для telebot.apihelper.API_URL."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/bot{{0}}/{{1}}"
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="fake-bot-api", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _throttle(self, method, params):
+        """Возвращает retry_after, если запрос превышает лимиты, иначе None."""
+        now = time.monotonic()
+        with self._lock:
+            if self.global_rate:
+                while self._recent and self._recent[0] <= now - 1:
+                    self._recent.popleft()
+                if len(self._recent) >= self.global_rate:
+                    return self.retry_after
+            chat_id = params.get("chat_id")
+            if self.per_chat_interval and method == "sendMessage" and chat_id:
+                last = self._chat_last.get(chat_id)
+                if last is not None and now - last < self.per_chat_interval:
+                    return self.retry_after
+                self._chat_last[chat_id] = now
+            if self.global_rate:
+                self._recent.append(now)
+        return None
+
+    def _result(self, method, params):
+        if method in ("sendMessage", "editMessageText"):
+            chat_id = int(params.get("chat_id") or 0)
+            if method == "editMessageText" and params.get("message_id"):
+                message_id = int(params["message_id"])
+            else:
+                message_id = next(self._message_ids)
+            return {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params.get("text", ""),
+            }
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "ShopBuddy"}
+        if method == "getUpdates":
+            return []
+        return True
+
+    def handle(self, method, params):
+        """Обрабатывает один вызов и возвращает (HTTP-код, JSON-ответ)."""
+        if self.latency:
+            time.sleep(self.latency)
+        retry_after = self._throttle(method, params)
+        with self._lock:
+            self.calls.append((time.time(), method, params))
+            self.counts[method] += 1
+            if retry_after is not None:
+                self.rejected += 1
+        if retry_after is not None:
+            return 429, {
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {retry_after}",
+                "parameters": {"retry_after": retry_after},
+            }
+        return 200, {"ok": True, "result": self._result(method, params)}
+
+    def _make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _serve(self):
+                parts = urlsplit(self.path)
+                method = parts.path.rsplit("/", 1)[-1]
+                params = dict(parse_qsl(parts.query))
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    body = self.rfile.read(length).decode()
+                    if self.headers.get("Content-Type", "").startswith(
+                        "application/json"
+                    ):
+                        params.update(json.loads(body))
+                    else:
+                        params.update(parse_qsl(body))
+                status, payload = api.handle(method, params)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = _serve
+            do_POST = _serve
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": len(self.calls),
+                "rejected_429": self.rejected,
+                "by_method": dict(self.counts),
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный поддельный Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--global-rate", type=int, default=None)
+    parser.add_argument("--per-chat-interval", type=float, default=None)
+    parser.add_argument("--retry-after", type=int, default=1)
+    args = parser.parse_args()
+
+    api = FakeBotAPI(
+        args.host,
+        args.port,
+        latency=args.latency,
+        global_rate=args.global_rate,
+        per_chat_interval=args.per_chat_interval,
+        retry_after=args.retry_after,
+    ).start()
+    print(f"Поддельный Bot API слушает {api.url}")
+    try:
+        while True:
+            time.sleep(5)
+            print(api.stats())
+    except KeyboardInterrupt:
+        api.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+# benchmarks/load.py
+"""Нагрузочный тест бота целиком: обработчики, SQLite и HTTP-вызовы Bot API.
+
+Бот работает в этом же процессе с отдельной временной базой и отправляет
+запросы на FakeBotAPI, поэтому настоящий Telegram и рабочая база не
+затрагиваются. Генератор создает пользователей, объединяет их в группы и
+выполняет смесь действий: добавление товаров, удаление, просмотр и листание
+списка, просмотр участников. Обновления подаются из нескольких потоков,
+действия одного пользователя выполняются по порядку.
+
+Запуск:
+    python -m benchmarks.load --users 1000 --actions 10 --concurrency 8
+    python -m benchmarks.load --latency 0.05 --global-rate 30 --json
+
+С --json результат печатается одной строкой JSON, чтобы сравнивать коммиты.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import types as module_types
+
+from benchmarks.fake_bot_api import FakeBotAPI
+
+# Доля каждого действия в смеси
+ACTIONS = {
+    "add": 40,
+    "add_many": 10,
+    "delete": 20,
+    "view": 20,
+    "page": 5,
+    "members": 5,
+}
+
+PRODUCTS = [
+    "Молоко",
+    "Хлеб",
+    "Сыр",
+    "Яйца",
+    "Масло",
+    "Кофе",
+    "Чай",
+    "Яблоки",
+    "Бананы",
+    "Курица",
+    "Рис",
+    "Гречка",
+]
+
+
+# Временный config.py для бота: своя база и адрес поддельного API
+def install_config(db_name, api_url):
+    config = module_types.ModuleType("config")
+    config.API_TOKEN = "123456:BENCHMARK"
+    config.DB_NAME = db_name
+    config.TELEGRAM_API_URL = api_url
+    # Генератор шлет обновления быстрее любого человека; лимиты частоты
+    # отбросили бы большую часть нагрузки
+    config.FLOOD_USER_RATE = None
+    config.FLOOD_GROUP_RATE = None
+    sys.modules["config"] = config
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class LoadGenerator:
+    """Строит обновления в формате Bot API и подает их боту."""
+
+    def __init__(self, bot_module, seed=0):
+        self.shop = bot_module
+        self.random = random.Random(seed)
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._ids_lock = threading.Lock()
+        self.latencies = []
+        self._latencies_lock = threading.Lock()
+
+    def _next_ids(self):
+        with self._ids_lock:
+            return next(self._update_ids), next(self._message_ids)
+
+    @staticmethod
+    def _user(user_id):
+        return {
+            "id": user_id,
+            "is_bot": False,
+            "first_name": f"User{user_id}",
+            "username": f"user{user_id}",
+        }
+
+    def message(self, user_id, text):
+        update_id, message_id = self._next_ids()
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": self._user(user_id),
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [
+                {"type": "bot_command", "offset": 0, "length": len(text)}
+            ]
+        return {"update_id": update_id, "message": message}
+
+    def callback(self, user_id, data):
+        update_id, message_id = self._next_ids()
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "chat_instance": str(user_id),
+                "from": self._user(user_id),
+                "data": data,
+                "message": {
+                    "message_id": message_id,
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "text": "",
+                },
+            },
+        }
+
+    def feed(self, update):
+        """Обрабатывает одно обновление и запоминает время обработки."""
+        from telebot import types
+
+        started = time.perf_counter()
+        self.shop.bot.process_new_updates([types.Update.de_json(update)])
+        elapsed = time.perf_counter() - started
+        with self._latencies_lock:
+            self.latencies.append(elapsed)
+
+    def item_to_delete(self, user_id):
+        group_id = self.shop.get_or_create_group(user_id)
+        row = self.shop.execute_query(
+            "SELECT item_id FROM lists WHERE group_id = ? ORDER BY RANDOM() LIMIT 1",
+            (group_id,),
+            fetchone=True,
+        )
+        return row[0] if row else None
+
+    def user_session(self, user_id, actions, rng):
+        """Выполняет actions случайных действий одного пользователя."""
+        names, weights = zip(*ACTIONS.items())
+        for action in rng.choices(names, weights, k=actions):
+            if action == "add":
+                self.feed(self.message(user_id, rng.choice(PRODUCTS)))
+                self.feed(self.callback(user_id, "add"))
+            elif action == "add_many":
+                items = rng.sample(PRODUCTS, 3)
+                self.feed(self.message(user_id, ", ".join(items)))
+                self.feed(self.callback(user_id, "add"))
+            elif action == "delete":
+                item_id = self.item_to_delete(user_id)
+                if item_id is not None:
+                    self.feed(self.callback(user_id, f"delete:{item_id}"))
+            elif action == "view":
+                self.feed(self.message(user_id, self.shop.SHOPPING_LIST))
+            elif action == "page":
+                self.feed(self.callback(user_id, f"page:{rng.randrange(3)}"))
+            elif action == "members":
+                self.feed(self.message(user_id, self.shop.VIEW_SHARED_USERS))
+
+    def run_parallel(self, user_ids, concurrency, session):
+        """Раздает пользователей потокам; у каждого пользователя один поток."""
+        chunks = [user_ids[index::concurrency] for index in range(concurrency)]
+
+        def worker(chunk, seed):
+            rng = random.Random(seed)
+            for user_id in chunk:
+                session(user_id, rng)
+
+        threads = [
+            threading.Thread(target=worker, args=(chunk, self.random.random()))
+            for chunk in chunks
+            if chunk
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+
+def run(args):
+    db_dir = tempfile.mkdtemp(prefix="shopbot-bench-")
+    db_name = os.path.join(db_dir, "bench.db")
+    api = FakeBotAPI(
+        latency=args.latency,
+        global_rate=args.global_rate,
+        per_chat_interval=args.per_chat_interval,
+        retry_after=args.retry_after,
+    ).start()
+    install_config(db_name, api.url)
+
+    import bot as shop
+    import db
+    import metrics
+
+    shop.create_tables()
+    # Обработчики выполняются в потоках генератора, как в пуле telebot
+    shop.bot.threaded = False
+    shop.notifier.start()
+    shop.outbox_sender.start()
+    generator = LoadGenerator(shop, seed=args.seed)
+    user_ids = list(range(1, args.users + 1))
+
+    started = time.perf_counter()
+    # Регистрация пользователей
+    generator.run_parallel(
+        user_ids,
+        args.concurrency,
+        lambda user_id, rng: generator.feed(generator.message(user_id, "/start")),
+    )
+    # Объединение в группы: первый участник делится кодом, остальные входят
+    owners = user_ids[:: args.group_size]
+    codes = {owner: shop.generate_share_code(owner) for owner in owners}
+
+    def join(user_id, rng):
+        owner = user_ids[(user_id - 1) // args.group_size * args.group_size]
+        if owner != user_id:
+            generator.feed(generator.message(user_id, shop.JOIN_LIST))
+            generator.feed(generator.message(user_id, codes[owner]))
+
+    generator.run_parallel(user_ids, args.concurrency, join)
+    # Основная смесь действий
+    generator.run_parallel(
+        user_ids,
+        args.concurrency,
+        lambda user_id, rng: generator.user_session(user_id, args.actions, rng),
+    )
+    elapsed = time.perf_counter() - started
+    # Вызовы API от обработчиков, без уже отправленных уведомлений
+    handler_calls = api.stats()["calls"] - shop.notifier.stats()["sent"]
+
+    # Даем уведомлениям уйти, чтобы учесть и их вызовы API
+    if args.drain:
+        deadline = time.monotonic() + args.drain
+        while time.monotonic() < deadline:
+            backlog = shop.outbox.backlog()["pending"]
+            if not backlog and not shop.notifier.queue_depth():
+                break
+            time.sleep(0.2)
+    shop.outbox_sender.stop(timeout=5)
+    shop.notifier.stop(timeout=5)
+
+    db.connections.get().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    db_size = sum(
+        os.path.getsize(os.path.join(db_dir, name)) for name in os.listdir(db_dir)
+    )
+    api_stats = api.stats()
+    updates = len(generator.latencies)
+    sql_queries = metrics.SQL_SECONDS.total_count()
+    result = {
+        "users": args.users,
+        "updates": updates,
+        "seconds": round(elapsed, 3),
+        "updates_per_sec": round(updates / elapsed, 1) if elapsed else 0.0,
+        "latency_p50_ms": round(percentile(generator.latencies, 0.5) * 1000, 2),
+        "latency_p99_ms": round(percentile(generator.latencies, 0.99) * 1000, 2),
+        "api_calls_per_update": round(handler_calls / updates, 2) if updates else 0,
+        "sql_queries_per_update": round(sql_queries / updates, 2) if updates else 0,
+        "api_calls_total": api_stats["calls"],
+        "api_rejected_429": api_stats["rejected_429"],
+        "api_by_method": api_stats["by_method"],
+        "notifications": shop.notifier.stats()["sent"],
+        "db_size_kb": round(db_size / 1024, 1),
+    }
+    db.connections.close_all()
+    api.stop()
+    if not args.keep_db:
+        for name in os.listdir(db_dir):
+            os.remove(os.path.join(db_dir, name))
+        os.rmdir(db_dir)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест ShopBuddy")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--group-size", type=int, default=4)
+    parser.add_argument(
+        "--actions", type=int, default=10, help="действий на пользователя"
+    )
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--global-rate", type=int, default=None)
+    parser.add_argument("--per-chat-interval", type=float, default=None)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument(
+        "--drain",
+        type=float,
+        default=0.0,
+        help="сколько секунд ждать доставки уведомлений после нагрузки",
+    )
+    parser.add_argument("--keep-db", action="store_true")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    result = run(args)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False))
+        return
+    for key, value in result.items():
+        print(f"{key:>24}: {value}")
+
+
+if __name__ == "__main__":
+    main()
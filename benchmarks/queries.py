@@ -0,0 +1,291 @@
+# benchmarks/queries.py
+"""Профилирование SQL бота на синтетической базе.
+
+Скрипт создает временную базу по текущим миграциям, наполняет ее
+пользователями, группами и товарами (можно миллионами строк), а затем
+многократно выполняет операции бота: те же функции, что вызывают
+обработчики в bot.py. Для каждой операции печатается время, а для каждого
+выполненного ею запроса - среднее время и план EXPLAIN QUERY PLAN.
+Полные просмотры таблиц и временные B-деревья для сортировки отмечаются,
+чтобы их можно было заметить до выката изменения схемы.
+
+Запуск:
+    python -m benchmarks.queries --users 100000 --items 2000000
+    python -m benchmarks.queries --only show_list --repeat 500 --json
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+import time
+from types import SimpleNamespace
+
+from benchmarks.load import install_config, percentile
+
+# Литералы, которые sqlite3 подставляет в текст запроса при трассировке
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|\bNULL\b")
+
+
+def statement_key(sql):
+    """Текст запроса без литералов, как его нормализуют метрики SQL."""
+    # metrics читает config, поэтому импортируется после install_config
+    from metrics import normalize_query
+
+    return normalize_query(LITERALS.sub("?", sql))
+
+
+def fill(db, users, group_size, items, outbox_rows, seed):
+    """Наполняет пустую базу синтетическими данными одной транзакцией."""
+    from migrations import backfill_item_history
+
+    rng = random.Random(seed)
+    groups = max(1, users // group_size)
+    now = time.time()
+    with db.transaction():
+        db.execute_many(
+            "INSERT INTO users (user_id, username, first_name) VALUES (?, ?, ?)",
+            (
+                (user_id, f"user{user_id}", f"User{user_id}")
+                for user_id in range(1, users + 1)
+            ),
+        )
+        # Коды выданы только что, чтобы process_join_code не упирался в срок действия
+        db.execute_many(
+            """
+            INSERT INTO groups (group_id, group_name, share_code, share_code_created_at)
+            VALUES (?, ?, ?, ?)
+        """,
+            (
+                (group_id, f"Group_{group_id}", f"code{group_id}", now)
+                for group_id in range(1, groups + 1)
+            ),
+        )
+        db.execute_many(
+            "INSERT INTO user_groups (user_id, group_id) VALUES (?, ?)",
+            ((user_id, (user_id - 1) % groups + 1) for user_id in range(1, users + 1)),
+        )
+        # Товары распределяются неравномерно: у части групп длинные списки
+        db.execute_many(
+            "INSERT OR IGNORE INTO lists (group_id, item) VALUES (?, ?)",
+            (
+                (int(groups * rng.random() ** 2) + 1, f"Товар {index}")
+                for index in range(items)
+            ),
+        )
+        db.execute_many(
+            """
+            INSERT INTO outbox (chat_id, group_id, kind, text, status, created_at, next_attempt_at)
+            VALUES (?, ?, 'add', 'text', ?, ?, ?)
+        """,
+            (
+                (
+                    rng.randrange(1, users + 1),
+                    rng.randrange(1, groups + 1),
+                    "sent" if index % 20 else "pending",
+                    now - rng.random() * 86400,
+                    now,
+                )
+                for index in range(outbox_rows)
+            ),
+        )
+        # История покупок: все товары списков, как после миграции
+        backfill_item_history()
+    db.execute_query("ANALYZE")
+    return groups
+
+
+def make_operations(shop, users, groups, rng):
+    """Операции бота: имя -> функция без аргументов со случайным пользователем."""
+
+    def user():
+        user_id = rng.randrange(1, users + 1)
+        return SimpleNamespace(id=user_id, first_name=f"User{user_id}")
+
+    def any_item(user_id):
+        row = shop.execute_query(
+            "SELECT item_id FROM lists WHERE group_id = ? LIMIT 1",
+            (shop.get_or_create_group(user_id),),
+            fetchone=True,
+        )
+        return row[0] if row else 0
+
+    def notify():
+        actor = user()
+        with shop.transaction():
+            shop.notify_group_users(
+                shop.get_or_create_group(actor.id),
+                "text",
+                actor.id,
+                kind="add",
+                actor_name=actor.first_name,
+                item="Товар",
+            )
+
+    return {
+        "get_or_create_group": lambda: shop.get_or_create_group(user().id),
+        "show_list": lambda: shop.load_list_view(user().id, user().id, 0),
+        "show_list_last_page": lambda: shop.load_list_view(
+            user().id, user().id, shop.LAST_PAGE
+        ),
+        "show_shared_users": lambda: shop.render_members(user().id),
+        "ask_to_add": lambda: shop.load_add_suggestions(user().id, ["Товар 1"]),
+        "add_items": lambda: shop.add_items(user(), [f"Новый {rng.random()}"]),
+        "delete_item": lambda: (
+            lambda actor: shop.remove_item(actor, any_item(actor.id))
+        )(user()),
+        "notify_group_users": notify,
+        "process_join_code": lambda: shop.join_group(
+            user(), f"code{rng.randrange(1, groups + 1)}"
+        ),
+        "clear_list": lambda: shop.clear_group_list(user()),
+    }
+
+
+def profile(shop, db, metrics, operations, repeat):
+    """Выполняет каждую операцию repeat раз и собирает время и планы запросов."""
+    report = {}
+    statements = {}
+    conn = db.connections.get()
+    conn.set_trace_callback(lambda sql: statements.setdefault(statement_key(sql), sql))
+    try:
+        for name, operation in operations.items():
+            statements.clear()
+            before = {
+                statement_key(pairs[0][1]): child.snapshot()
+                for pairs, child in metrics.SQL_SECONDS._samples()
+            }
+            timings = []
+            for _ in range(repeat):
+                # Кэши сбрасываются, чтобы мерить запросы, а не память
+                shop.user_group_cache.clear()
+                shop.group_members_cache.clear()
+                shop.render_cache.clear()
+                started = time.perf_counter()
+                operation()
+                timings.append(time.perf_counter() - started)
+            after = {
+                statement_key(pairs[0][1]): child.snapshot()
+                for pairs, child in metrics.SQL_SECONDS._samples()
+            }
+            report[name] = {
+                "p50_ms": round(percentile(timings, 0.5) * 1000, 3),
+                "p95_ms": round(percentile(timings, 0.95) * 1000, 3),
+                "max_ms": round(max(timings) * 1000, 3),
+                "queries": explain(conn, statements, before, after, repeat),
+            }
+    finally:
+        conn.set_trace_callback(None)
+    return report
+
+
+def explain(conn, statements, before, after, repeat):
+    """План и среднее время каждого запроса, выполненного операцией."""
+    queries = []
+    for key, example in statements.items():
+        if key in ("BEGIN IMMEDIATE", "COMMIT", "ROLLBACK"):
+            continue
+        _, total, count = after.get(key, ([], 0.0, 0))
+        _, total_before, count_before = before.get(key, ([], 0.0, 0))
+        calls = count - count_before
+        try:
+            plan = [
+                row[3]
+                for row in conn.execute(f"EXPLAIN QUERY PLAN {example}").fetchall()
+            ]
+        except Exception as e:
+            plan = [f"не удалось построить план: {e}"]
+        warnings = [
+            line
+            for line in plan
+            # SCAN - проход по всей таблице или всему индексу, в отличие от SEARCH
+            if line.startswith("SCAN ") or "TEMP B-TREE" in line
+        ]
+        queries.append(
+            {
+                "query": key,
+                "calls_per_op": round(calls / repeat, 2),
+                "avg_ms": round((total - total_before) / calls * 1000, 3)
+                if calls
+                else None,
+                "plan": plan,
+                "warnings": warnings,
+            }
+        )
+    return queries
+
+
+def print_report(report):
+    for name, result in report.items():
+        print(
+            f"\n=== {name}: p50 {result['p50_ms']} мс, p95 {result['p95_ms']} мс, "
+            f"max {result['max_ms']} мс"
+        )
+        for query in result["queries"]:
+            mark = "!!" if query["warnings"] else "  "
+            print(
+                f"{mark} {query['calls_per_op']}x {query['avg_ms']} мс  {query['query']}"
+            )
+            for line in query["plan"]:
+                print(f"       {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Профилирование SQL ShopBuddy")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--group-size", type=int, default=3)
+    parser.add_argument("--items", type=int, default=200000)
+    parser.add_argument("--outbox", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--only", action="append", help="профилировать только эту операцию"
+    )
+    parser.add_argument("--keep-db", action="store_true")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    db_dir = tempfile.mkdtemp(prefix="shopbot-queries-")
+    install_config(os.path.join(db_dir, "queries.db"), None)
+
+    import bot as shop
+    import db
+    import metrics
+
+    # Уведомления только пишутся в outbox, в Telegram ничего не уходит
+    shop.outbox_sender.autostart = False
+    shop.create_tables()
+    # Наполнение базы - не запросы бота, предупреждения о медленных запросах не нужны
+    logging.getLogger("metrics").setLevel(logging.ERROR)
+    started = time.perf_counter()
+    groups = fill(db, args.users, args.group_size, args.items, args.outbox, args.seed)
+    logging.getLogger("metrics").setLevel(logging.NOTSET)
+    if not args.json:
+        print(f"База заполнена за {time.perf_counter() - started:.1f} с")
+
+    operations = make_operations(shop, args.users, groups, random.Random(args.seed))
+    if args.only:
+        operations = {name: operations[name] for name in args.only}
+    # Метрики SQL копятся по тексту запроса с параметрами "?", так что запрос
+    # из трассировки сопоставляется с ними по тексту без литералов
+    report = profile(shop, db, metrics, operations, args.repeat)
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+    else:
+        print_report(report)
+
+    db.connections.close_all()
+    if not args.keep_db:
+        for name in os.listdir(db_dir):
+            os.remove(os.path.join(db_dir, name))
+        os.rmdir(db_dir)
+    else:
+        print(f"База сохранена: {db_dir}")
+
+
+if __name__ == "__main__":
+    main()
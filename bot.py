@@ -1,11 +1,48 @@
 # bot.py
 
 import logging
-import sqlite3
+import re
+import time
 import telebot
 from telebot import types, custom_filters
+from telebot.handler_backends import BaseMiddleware, CancelUpdate
 import uuid
-from config import API_TOKEN, DB_NAME
+from cache import LRUCache
+import metrics
+from config import API_TOKEN
+from db import after_commit, execute_many, execute_query, transaction
+from migrations import migrate
+import history
+import outbox
+from maintenance import GarbageCollector
+from notifier import Notifier
+from periodic import PeriodicTask
+from ratelimit import FloodControl
+from router import Router, callback_data
+from settings import (
+    FLOOD_GROUP_BURST,
+    FLOOD_GROUP_RATE,
+    FLOOD_MAX_TRACKED,
+    FLOOD_USER_BURST,
+    FLOOD_USER_RATE,
+    GC_INTERVAL,
+    ITEM_SUGGESTIONS,
+    NOTIFY_GLOBAL_RATE,
+    NOTIFY_MAX_RETRIES,
+    NOTIFY_PER_CHAT_INTERVAL,
+    LIST_ITEM_DISPLAY_LENGTH,
+    LIST_PAGE_SIZE,
+    MAX_ITEMS_PER_MESSAGE,
+    MEMBERSHIP_CACHE_SIZE,
+    NOTIFY_WORKERS,
+    RENDER_CACHE_SIZE,
+    REPEAT_PERIOD,
+    SHARE_CODE_TTL,
+    STATE_SWEEP_INTERVAL,
+    STATE_TTL,
+    TELEGRAM_API_URL,
+)
+from state_storage import SQLiteStateStorage
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -19,95 +56,52 @@ JOIN_LIST = "👥 Присоединиться к списку"
 VIEW_SHARED_USERS = "👤 Участники списка"
 ABOUT_APP = "ℹ️ О приложении"
 
-COMMANDS = [
-    SHOPPING_LIST,
-    CLEAR_LIST,
-    SHARE_LIST,
-    JOIN_LIST,
-    VIEW_SHARED_USERS,
-    ABOUT_APP,
-]
-
 # Инициализация бота
-bot = telebot.TeleBot(API_TOKEN)
+if TELEGRAM_API_URL:
+    telebot.apihelper.API_URL = TELEGRAM_API_URL
+# Состояния диалогов хранятся в базе, чтобы переживать перезапуск бота
+state_storage = SQLiteStateStorage(ttl=STATE_TTL)
+state_sweeper = PeriodicTask("state-sweeper", state_storage.sweep, STATE_SWEEP_INTERVAL)
+# Middleware нужны для ограничения частоты обновлений (flood_control)
+bot = telebot.TeleBot(
+    API_TOKEN, state_storage=state_storage, use_class_middlewares=True
+)
+metrics.instrument_bot_api()
 bot.add_custom_filter(custom_filters.StateFilter(bot))
 
 
 # Определение состояний пользователя
 class States:
     ADD_ITEM = "add_item"
+    JOIN_CODE = "join_code"
 
 
-# Функция для выполнения запросов к базе данных
-def execute_query(query, params=(), fetch=False, fetchone=False, lastrowid=False):
-    try:
-        with sqlite3.connect(DB_NAME) as conn:
-            conn.execute("PRAGMA foreign_keys = ON")
-            cursor = conn.cursor()
-            cursor.execute(query, params)
-            if lastrowid:
-                return cursor.lastrowid
-            elif fetchone:
-                return cursor.fetchone()
-            elif fetch:
-                return cursor.fetchall()
-            return None
-    except sqlite3.Error as e:
-        logger.error(f"Ошибка базы данных: {e}")
-        raise
+# Ответ на запрос кода приглашения. Следующее текстовое сообщение считается
+# кодом, поэтому обработчик регистрируется раньше всех остальных
+@bot.message_handler(state=States.JOIN_CODE)
+@metrics.timed_handler
+def handle_join_code(message):
+    bot.delete_state(message.from_user.id, message.chat.id)
+    process_join_code(message)
 
 
-# Создание необходимых таблиц в базе данных
+# Создание и обновление схемы базы данных
 def create_tables():
-    execute_query(
-        """
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY,
-            username TEXT,
-            first_name TEXT
-        )
-    """
-    )
-    execute_query(
-        """
-        CREATE TABLE IF NOT EXISTS groups (
-            group_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            group_name TEXT,
-            share_code TEXT UNIQUE
-        )
-    """
-    )
-    execute_query(
-        """
-        CREATE TABLE IF NOT EXISTS user_groups (
-            user_id INTEGER,
-            group_id INTEGER,
-            PRIMARY KEY (user_id, group_id),
-            FOREIGN KEY (user_id) REFERENCES users(user_id),
-            FOREIGN KEY (group_id) REFERENCES groups(group_id)
-        )
-    """
-    )
-    execute_query(
-        """
-        CREATE TABLE IF NOT EXISTS lists (
-            item_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            group_id INTEGER,
-            item TEXT,
-            FOREIGN KEY (group_id) REFERENCES groups(group_id)
-        )
-    """
-    )
+    migrate()
 
 
 # Экранирование специальных символов Markdown
+MARKDOWN_ESCAPE_TABLE = str.maketrans(
+    {char: "\\" + char for char in "_*[]()~`>#+-=|{}.!\\"}
+)
+
+
 def escape_markdown(text):
-    escape_chars = "_*[]()~`>#+-=|{}.!\\"
-    return "".join(["\\" + char if char in escape_chars else char for char in text])
+    return text.translate(MARKDOWN_ESCAPE_TABLE)
 
 
 # Главное меню клавиатуры
-def main_menu(has_items=True):
+def build_main_menu(has_items):
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
     markup.add(SHOPPING_LIST)
     if has_items:
@@ -119,35 +113,179 @@ def main_menu(has_items=True):
     return markup
 
 
+# Оба варианта меню строятся один раз при импорте
+MAIN_MENUS = {True: build_main_menu(True), False: build_main_menu(False)}
+
+
+def main_menu(has_items=True):
+    return MAIN_MENUS[bool(has_items)]
+
+
+# Вариант меню, который show_list в последний раз отправил в чат
+def chat_menu(chat_id):
+    """Остальные ответы прикрепляют тот же вариант, чтобы флаг menu_has_items
+    в live_messages всегда соответствовал клавиатуре пользователя."""
+    menu_has_items = get_live_message(chat_id)[1]
+    return main_menu(menu_has_items is None or menu_has_items)
+
+
 # Функция для отправки сообщений с Markdown и главным меню
 def send_markdown_message(chat_id, text, reply_markup=None):
-    bot.send_message(
+    return bot.send_message(
         chat_id,
         text,
-        reply_markup=reply_markup or main_menu(),
+        reply_markup=reply_markup or chat_menu(chat_id),
         parse_mode="Markdown",
     )
 
 
-# Функция для отправки действия "печатает"
-def send_typing_action(chat_id):
-    bot.send_chat_action(chat_id, "typing")
+# Фоновая рассылка уведомлений участникам групп
+notifier = Notifier(
+    send_markdown_message,
+    workers=NOTIFY_WORKERS,
+    global_rate=NOTIFY_GLOBAL_RATE,
+    per_chat_interval=NOTIFY_PER_CHAT_INTERVAL,
+    max_retries=NOTIFY_MAX_RETRIES,
+)
+# Доставка уведомлений из outbox через notifier (render_digest объявлена ниже)
+outbox_sender = outbox.OutboxSender(
+    notifier, render=lambda events: render_digest(events)
+)
+metrics.registry.gauge(
+    "shopbot_notify_queue_depth",
+    "Уведомления, ожидающие отправки в notifier",
+    notifier.queue_depth,
+)
+metrics.registry.gauge(
+    "shopbot_outbox_pending",
+    "Недоставленные уведомления в outbox",
+    lambda: outbox.backlog()["pending"],
+)
+
+
+# Редактирование ранее отправленного сообщения с Markdown
+def edit_markdown_message(chat_id, message_id, text, reply_markup=None):
+    """Возвращает False, если сообщение удалено или его нельзя отредактировать."""
+    try:
+        bot.edit_message_text(
+            text,
+            chat_id=chat_id,
+            message_id=message_id,
+            reply_markup=reply_markup,
+            parse_mode="Markdown",
+        )
+    except telebot.apihelper.ApiTelegramException as e:
+        if "message is not modified" in e.description:
+            return True
+        if e.error_code == 400:
+            return False
+        raise
+    return True
+
+
+# Удаление сообщения, которое могло уже исчезнуть
+def delete_message_quietly(chat_id, message_id):
+    try:
+        bot.delete_message(chat_id, message_id)
+    except telebot.apihelper.ApiTelegramException as e:
+        # Сообщения старше 48 часов удалить нельзя, их просто оставляем
+        logger.info(f"Не удалось удалить сообщение {message_id}: {e.description}")
 
 
 # Обработчик команды /start
 @bot.message_handler(commands=["start"])
+@metrics.timed_handler
 def start(message):
-    user_id = message.from_user.id
-    username = message.from_user.username or ""
-    first_name = message.from_user.first_name or ""
+    register_user(message.from_user)
+    send_welcome_message(message)
 
-    # Сохраняем пользователя в базе данных
-    execute_query(
+
+# Все остальные сообщения и нажатия на кнопки распределяет таблица маршрутов
+router = Router()
+
+
+@bot.message_handler(func=lambda message: True)
+def route_message(message):
+    handler = router.message_route(message)
+    if handler is not None:
+        with metrics.HANDLER_SECONDS.time(handler.__name__):
+            handler(message)
+
+
+@bot.callback_query_handler(func=lambda call: True)
+def route_callback(call):
+    handler, payload = router.callback_route(call)
+    if handler is not None:
+        with metrics.HANDLER_SECONDS.time(handler.__name__):
+            handler(call, payload)
+
+
+# Ограничение частоты обновлений от одного пользователя и одной группы.
+# Проверка выполняется до фильтров обработчиков, поэтому отброшенное
+# обновление не обращается к базе, даже за состоянием диалога
+flood_control = FloodControl(
+    FLOOD_USER_RATE,
+    FLOOD_USER_BURST,
+    FLOOD_GROUP_RATE,
+    FLOOD_GROUP_BURST,
+    FLOOD_MAX_TRACKED,
+)
+FLOOD_DROPPED = metrics.registry.counter(
+    "shopbot_flood_dropped_total",
+    "Обновления, отброшенные из-за превышения лимита",
+    ("scope", "update"),
+)
+
+
+def allow_update(update):
+    """Возвращает False, если отправитель превысил лимит.
+
+    Группа берется только из кэша членства: если ее там нет, проверяется
+    лишь лимит пользователя.
+    """
+    if update.from_user is None:
+        return True
+    user_id = update.from_user.id
+    scope = flood_control.check(user_id, user_group_cache.get(user_id))
+    if scope is None:
+        return True
+    kind = "callback" if isinstance(update, types.CallbackQuery) else "message"
+    FLOOD_DROPPED.inc(scope, kind)
+    return False
+
+
+class FloodControlMiddleware(BaseMiddleware):
+    update_types = ["message", "callback_query"]
+
+    def pre_process(self, update, data):
+        if not allow_update(update):
+            return CancelUpdate()
+
+    def post_process(self, update, data, exception):
+        # С middleware telebot сам перехватывает ошибки обработчиков и пишет
+        # в лог только текст, поэтому traceback логируем здесь
+        if exception is not None:
+            logger.error("Ошибка в обработчике обновления", exc_info=exception)
+
+
+bot.setup_middleware(FloodControlMiddleware())
+
+
+# Сохранение пользователя в базе данных
+def register_user(user):
+    inserted = execute_query(
         "INSERT OR IGNORE INTO users (user_id, username, first_name) VALUES (?, ?, ?)",
-        (user_id, username, first_name),
+        (user.id, user.username or "", user.first_name or ""),
+        rowcount=True,
     )
-
-    send_welcome_message(message)
+    if not inserted:
+        return
+    # Пользователь мог уже состоять в группе и теперь появится среди ее участников
+    groups = execute_query(
+        "SELECT group_id FROM user_groups WHERE user_id = ?", (user.id,), fetch=True
+    )
+    if groups:
+        invalidate_membership(group_ids=[group[0] for group in groups])
 
 
 # Отправка приветственного сообщения и главного меню
@@ -163,25 +301,93 @@ WELCOME_MESSAGE = (
 )
 
 
+def render_welcome(user):
+    return WELCOME_MESSAGE.format(first_name=escape_markdown(user.first_name or "друг"))
+
+
 def send_welcome_message(message):
-    text = WELCOME_MESSAGE.format(
-        first_name=escape_markdown(message.from_user.first_name or "друг")
-    )
     send_markdown_message(
         message.chat.id,
-        text,
+        render_welcome(message.from_user),
+    )
+
+
+# Кэши членства: user_id -> group_id и group_id -> участники группы
+user_group_cache = LRUCache(MEMBERSHIP_CACHE_SIZE)
+group_members_cache = LRUCache(MEMBERSHIP_CACHE_SIZE)
+
+
+def invalidate_membership(user_ids=(), group_ids=(), shared=True):
+    """Сбрасывает кэши членства после коммита текущей транзакции.
+
+    Вызывайте при любом изменении user_groups: создании группы,
+    переходе пользователя в другую группу. shared=False - изменение не могло
+    попасть в кэши других процессов (новая или удаляемая пустая группа).
+    """
+    # Другие процессы узнают об изменении по счетчику в базе
+    if shared:
+        execute_query("UPDATE counters SET value = value + 1 WHERE name = 'membership'")
+
+    def invalidate():
+        for user_id in user_ids:
+            user_group_cache.invalidate(user_id)
+        for group_id in group_ids:
+            group_members_cache.invalidate(group_id)
+
+    after_commit(invalidate)
+
+
+# Когда с базой работают несколько процессов (dispatcher.py), изменения
+# членства в одном из них должны сбрасывать кэши остальных
+membership_epoch = None
+
+
+def sync_membership_caches():
+    """Очищает кэши членства, если другой процесс изменил членство в группах.
+
+    Рабочий процесс dispatcher.py вызывает ее перед каждым обновлением.
+    """
+    global membership_epoch
+    epoch = execute_query(
+        "SELECT value FROM counters WHERE name = 'membership'", fetchone=True
+    )[0]
+    if epoch != membership_epoch:
+        user_group_cache.clear()
+        group_members_cache.clear()
+        membership_epoch = epoch
+
+
+# Фоновая уборка групп без участников и просроченных кодов приглашения
+garbage_collector = GarbageCollector(
+    on_groups_deleted=lambda group_ids: invalidate_membership(
+        group_ids=group_ids, shared=False
     )
+)
+maintenance_task = PeriodicTask("maintenance", garbage_collector.run, GC_INTERVAL)
 
 
 # Получение или создание группы для пользователя
 def get_or_create_group(user_id):
     """Возвращает ID группы для данного пользователя, создавая новую, если необходимо."""
+    group_id = user_group_cache.get(user_id)
+    if group_id is not None:
+        return group_id
+    generation = user_group_cache.generation
     group = execute_query(
         "SELECT group_id FROM user_groups WHERE user_id = ?", (user_id,), fetchone=True
     )
     if group:
+        user_group_cache.put(user_id, group[0], generation)
         return group[0]
-    else:
+    with transaction():
+        # Проверяем повторно: группу мог создать параллельный запрос
+        group = execute_query(
+            "SELECT group_id FROM user_groups WHERE user_id = ?",
+            (user_id,),
+            fetchone=True,
+        )
+        if group:
+            return group[0]
         # Создаем новую группу
         new_group_id = execute_query(
             "INSERT INTO groups (group_name) VALUES (?)",
@@ -192,311 +398,750 @@ def get_or_create_group(user_id):
             "INSERT INTO user_groups (user_id, group_id) VALUES (?, ?)",
             (user_id, new_group_id),
         )
+        invalidate_membership(
+            user_ids=[user_id], group_ids=[new_group_id], shared=False
+        )
         return new_group_id
 
 
+# Участники группы с именами
+def get_group_members(group_id):
+    """Возвращает [(first_name, username), ...] участников группы."""
+    members = group_members_cache.get(group_id)
+    if members is None:
+        generation = group_members_cache.generation
+        members = execute_query(
+            """
+            SELECT u.first_name, u.username FROM user_groups ug
+            JOIN users u ON ug.user_id = u.user_id
+            WHERE ug.group_id = ?
+        """,
+            (group_id,),
+            fetch=True,
+        )
+        group_members_cache.put(group_id, members, generation)
+    return members
+
+
 # Уведомление участников группы о изменениях
-def notify_group_users(group_id, message_text, actor_id, exclude_actor=True):
-    """Уведомляет пользователей в группе об изменениях."""
-    users = execute_query(
-        "SELECT user_id FROM user_groups WHERE group_id = ?", (group_id,), fetch=True
+def notify_group_users(
+    group_id,
+    message_text,
+    actor_id,
+    exclude_actor=True,
+    kind="message",
+    actor_name=None,
+    item=None,
+):
+    """Записывает уведомления участникам группы в outbox.
+
+    Вызывайте внутри транзакции, изменяющей список: уведомления сохранятся
+    вместе с изменением, а отправитель проснется после коммита.
+    """
+    notify_group_users_many(
+        group_id,
+        [(message_text, item)],
+        actor_id,
+        exclude_actor=exclude_actor,
+        kind=kind,
+        actor_name=actor_name,
     )
 
-    for user in users:
-        user_id = user[0]
-        if exclude_actor and user_id == actor_id:
-            continue
-        try:
-            send_markdown_message(user_id, message_text)
-        except telebot.apihelper.ApiTelegramException as e:
-            if e.error_code == 403:
-                logger.error(
-                    f"Не могу отправить сообщение пользователю {user_id}: {e.description}"
-                )
-            else:
-                logger.error(
-                    f"Ошибка отправки сообщения пользователю {user_id}: {e.description}"
-                )
+
+def notify_group_users_many(
+    group_id, events, actor_id, exclude_actor=True, kind="message", actor_name=None
+):
+    """Как notify_group_users, но для нескольких событий [(текст, товар), ...].
+
+    Получатель увидит их одной сводкой.
+    """
+    outbox.enqueue_many(
+        group_id,
+        kind,
+        events,
+        exclude_user_id=actor_id if exclude_actor else None,
+        actor_name=actor_name,
+    )
+    after_commit(outbox_sender.wake)
+
+
+# Склонение существительного после числа: plural(5, ("товар", "товара", "товаров"))
+def plural(count, forms):
+    if count % 10 == 1 and count % 100 != 11:
+        return forms[0]
+    if 2 <= count % 10 <= 4 and not 12 <= count % 100 <= 14:
+        return forms[1]
+    return forms[2]
+
+
+ITEM_FORMS = ("товар", "товара", "товаров")
+
+
+# Сводка нескольких изменений списка в одном уведомлении
+def render_digest(events):
+    """Объединяет события outbox для одного получателя в одно сообщение."""
+    if len(events) == 1:
+        return events[0].text
+
+    # Считаем действия каждого участника в порядке первого появления
+    actors = {}
+    for event in events:
+        counts = actors.setdefault(event.actor_name or "Кто-то", {})
+        counts[event.kind] = counts.get(event.kind, 0) + 1
+
+    lines = []
+    for actor_name, counts in actors.items():
+        actions = []
+        if counts.get("join"):
+            actions.append("присоединился к списку")
+        if counts.get("clear"):
+            actions.append("очистил список")
+        if counts.get("add"):
+            actions.append(
+                f"добавил {counts['add']} {plural(counts['add'], ITEM_FORMS)}"
+            )
+        if counts.get("delete"):
+            actions.append(
+                f"удалил {counts['delete']} {plural(counts['delete'], ITEM_FORMS)}"
+            )
+        if counts.get("message"):
+            actions.append(f"уведомлений: {counts['message']}")
+        lines.append(f"• *{escape_markdown(actor_name)}* {', '.join(actions)}")
+    return "🛒 *Изменения в списке покупок:*\n\n" + "\n".join(lines)
 
 
 # Обработка объединения списков (создание кода для обмена)
-@bot.message_handler(func=lambda message: message.text == SHARE_LIST)
+@router.text(SHARE_LIST)
 def share_list(message):
     """Предлагает пользователю поделиться списком с другим пользователем."""
     share_code = generate_share_code(message.from_user.id)
     send_markdown_message(
         message.chat.id,
-        f"🔗 *Ваш код для совместного списка*: `{share_code}`\n\n"
-        "Отправьте этот код другу, чтобы он мог присоединиться к вашему списку.\n\n"
-        'Когда ваш друг будет готов, пусть нажмет кнопку *"Присоединиться к списку"* и введет код.',
+        SHARE_MESSAGE.format(share_code=share_code),
     )
 
 
+SHARE_MESSAGE = (
+    "🔗 *Ваш код для совместного списка*: `{share_code}`\n\n"
+    "Отправьте этот код другу, чтобы он мог присоединиться к вашему списку.\n\n"
+    'Когда ваш друг будет готов, пусть нажмет кнопку *"Присоединиться к списку"* и введет код.'
+)
+
+
 # Генерация кода для объединения списков
 def generate_share_code(user_id):
     group_id = get_or_create_group(user_id)
     share_code = str(uuid.uuid4())[:8]
     execute_query(
-        "UPDATE groups SET share_code = ? WHERE group_id = ?", (share_code, group_id)
+        "UPDATE groups SET share_code = ?, share_code_created_at = ? WHERE group_id = ?",
+        (share_code, time.time(), group_id),
     )
     return share_code
 
 
+# Истек ли срок действия кода приглашения
+def share_code_expired(created_at):
+    return bool(SHARE_CODE_TTL) and (
+        created_at is None or created_at < time.time() - SHARE_CODE_TTL
+    )
+
+
 # Обработка присоединения к списку
-@bot.message_handler(func=lambda message: message.text == JOIN_LIST)
+@router.text(JOIN_LIST)
 def join_list(message):
     """Обрабатывает присоединение к существующему списку по коду."""
     send_markdown_message(
         message.chat.id,
-        "🔑 *Введите код для присоединения к списку:*",
+        JOIN_PROMPT,
         reply_markup=types.ReplyKeyboardRemove(),
     )
-    bot.register_next_step_handler(message, process_join_code)
+    bot.set_state(message.from_user.id, States.JOIN_CODE, message.chat.id)
+
+
+JOIN_PROMPT = "🔑 *Введите код для присоединения к списку:*"
 
 
 def process_join_code(message):
-    share_code = message.text.strip()
-    group = execute_query(
-        "SELECT group_id FROM groups WHERE share_code = ?", (share_code,), fetchone=True
-    )
-    if group:
+    joined = join_group(message.from_user, message.text.strip())
+    send_markdown_message(message.chat.id, JOIN_REPLIES[joined])
+
+
+# Ответы на код приглашения: неверный код, успешный переход, уже в группе
+JOIN_REPLIES = {
+    None: "❌ *Неверный код. Пожалуйста, проверьте код и попробуйте снова.*",
+    True: "🎉 *Вы успешно присоединились к списку!*",
+    False: "ℹ️ *Вы уже состоите в этом списке.*",
+}
+
+
+# Переход пользователя в группу по коду приглашения
+def join_group(user, share_code):
+    """Возвращает None для неверного кода, True после перехода и False, если
+    пользователь уже состоит в группе."""
+    user_id = user.id
+    # Поиск группы и переход в нее выполняются атомарно
+    with transaction():
+        group = execute_query(
+            "SELECT group_id, share_code_created_at FROM groups WHERE share_code = ?",
+            (share_code,),
+            fetchone=True,
+        )
+        # Просроченный код еще может быть в базе до следующей уборки
+        if not group or share_code_expired(group[1]):
+            return None
         group_id = group[0]
-        user_id = message.from_user.id
         # Проверяем, не состоит ли пользователь уже в этой группе
         existing = execute_query(
             "SELECT 1 FROM user_groups WHERE user_id = ? AND group_id = ?",
             (user_id, group_id),
             fetchone=True,
         )
-        if not existing:
-            # Удаляем пользователя из его текущей группы
-            execute_query("DELETE FROM user_groups WHERE user_id = ?", (user_id,))
-            # Добавляем в новую группу
-            execute_query(
-                "INSERT INTO user_groups (user_id, group_id) VALUES (?, ?)",
-                (user_id, group_id),
-            )
-            send_markdown_message(
-                message.chat.id,
-                "🎉 *Вы успешно присоединились к списку!*",
-            )
-            # Уведомляем других участников группы
-            notify_group_users(
-                group_id,
-                f"👥 *{escape_markdown(message.from_user.first_name)}* присоединился к вашему списку!",
-                user_id,
-            )
-        else:
-            send_markdown_message(
-                message.chat.id,
-                "ℹ️ *Вы уже состоите в этом списке.*",
-            )
-    else:
-        send_markdown_message(
-            message.chat.id,
-            "❌ *Неверный код. Пожалуйста, проверьте код и попробуйте снова.*",
+        if existing:
+            return False
+        old_groups = execute_query(
+            "SELECT group_id FROM user_groups WHERE user_id = ?",
+            (user_id,),
+            fetch=True,
+        )
+        # Удаляем пользователя из его текущей группы
+        execute_query("DELETE FROM user_groups WHERE user_id = ?", (user_id,))
+        # Добавляем в новую группу
+        execute_query(
+            "INSERT INTO user_groups (user_id, group_id) VALUES (?, ?)",
+            (user_id, group_id),
+        )
+        invalidate_membership(
+            user_ids=[user_id],
+            group_ids=[group_id, *(row[0] for row in old_groups)],
+        )
+        # Уведомляем других участников группы
+        notify_group_users(
+            group_id,
+            f"👥 *{escape_markdown(user.first_name)}* присоединился к вашему списку!",
+            user_id,
+            kind="join",
+            actor_name=user.first_name,
         )
+        return True
+
+
+# Разделители товаров: перевод строки, точка с запятой и запятая,
+# если за ней не идет цифра (чтобы не разрезать "Молоко 2,5%")
+ITEM_SEPARATORS = re.compile(r"[\n;]|,(?!\d)")
+
+
+# Разбор сообщения с одним или несколькими товарами
+def parse_items(text):
+    """Возвращает (товары без пустых строк, маркеров и повторов, число лишних).
+
+    Берутся первые MAX_ITEMS_PER_MESSAGE товаров, остальные только считаются.
+    """
+    items = []
+    seen = set()
+    for part in ITEM_SEPARATORS.split(text):
+        item = part.strip().lstrip("-•*").strip()
+        if item and item.casefold() not in seen:
+            seen.add(item.casefold())
+            items.append(item)
+    return items[:MAX_ITEMS_PER_MESSAGE], max(0, len(items) - MAX_ITEMS_PER_MESSAGE)
 
 
 # Обработка добавления элементов по тексту
-@bot.message_handler(func=lambda message: message.text not in COMMANDS)
+@router.default
 def ask_to_add(message):
-    """Спрашивает пользователя, хочет ли он добавить товар в список."""
-    item = message.text.strip()
-    if item:
+    """Спрашивает пользователя, хочет ли он добавить товары в список.
+
+    В одном сообщении можно перечислить несколько товаров через запятую
+    или с новой строки, они подтверждаются одним нажатием.
+    """
+    items, skipped = parse_items(message.text)
+    if items:
         user_id = message.from_user.id
         # Сохраняем состояние пользователя и передаем данные через аргументы
         bot.set_state(user_id, States.ADD_ITEM, message.chat.id)
         with bot.retrieve_data(user_id, message.chat.id) as data:
-            data["item"] = item
-        markup = types.InlineKeyboardMarkup()
-        markup.add(types.InlineKeyboardButton(text="✅ Да", callback_data=f"add_yes"))
-        markup.add(types.InlineKeyboardButton(text="❌ Нет", callback_data="cancel"))
-        send_markdown_message(
-            message.chat.id,
-            f'🛍️ *Добавить товар* "{escape_markdown(item)}" *в ваш список покупок?*',
-            reply_markup=markup,
-        )
+            data["items"] = items
+        suggestions, recent = load_add_suggestions(user_id, items)
+        text, markup = render_add_prompt(items, suggestions, len(recent), skipped)
+        send_markdown_message(message.chat.id, text, reply_markup=markup)
     else:
         send_markdown_message(
             message.chat.id,
-            "⚠️ *Пожалуйста, введите название продукта.*",
+            EMPTY_ITEM_MESSAGE,
         )
 
 
+EMPTY_ITEM_MESSAGE = "⚠️ *Пожалуйста, введите название продукта.*"
+
+
+# Подсказки из истории покупок группы для вопроса о добавлении
+def load_add_suggestions(user_id, items):
+    """Возвращает (подсказки [(history_id, товар), ...], товары за неделю).
+
+    Подсказки ищутся по началу названия, только если введен один товар.
+    """
+    group_id = get_or_create_group(user_id)
+    suggestions = []
+    if len(items) == 1:
+        suggestions = history.suggest(group_id, items[0], ITEM_SUGGESTIONS)
+    return suggestions, history.recent(group_id, REPEAT_PERIOD, MAX_ITEMS_PER_MESSAGE)
+
+
+# Предельная длина текста сообщения в Telegram
+MESSAGE_LENGTH_LIMIT = 4096
+
+
+# Вопрос о добавлении товаров с кнопками подтверждения
+def render_add_prompt(items, suggestions=(), recent_count=0, skipped=0):
+    """suggestions - товары из истории, которые добавляются одним нажатием,
+    recent_count - сколько товаров можно вернуть кнопкой повтора,
+    skipped - сколько товаров не вошло в MAX_ITEMS_PER_MESSAGE.
+
+    Текст укладывается в MESSAGE_LENGTH_LIMIT: если перечень товаров не
+    помещается, показываются первые из них и "…и ещё K".
+    """
+    markup = types.InlineKeyboardMarkup()
+    markup.add(
+        types.InlineKeyboardButton(text="✅ Да", callback_data=callback_data("add"))
+    )
+    markup.add(
+        types.InlineKeyboardButton(text="❌ Нет", callback_data=callback_data("cancel"))
+    )
+    for history_id, item in suggestions:
+        markup.add(
+            types.InlineKeyboardButton(
+                text=f"➕ {shorten(item, 40)}",
+                callback_data=callback_data("hist", history_id),
+            )
+        )
+    if recent_count:
+        markup.add(
+            types.InlineKeyboardButton(
+                text=f"🔁 Вернуть товары за неделю ({recent_count})",
+                callback_data=callback_data("repeat"),
+            )
+        )
+    footer = ""
+    if skipped:
+        footer = (
+            f"\n\n⚠️ За один раз можно добавить не больше {MAX_ITEMS_PER_MESSAGE} "
+            f"{plural(MAX_ITEMS_PER_MESSAGE, ITEM_FORMS)}, остальные {skipped} "
+            f"не добавлены."
+        )
+    if len(items) == 1:
+        # Экранирование может удвоить длину, поэтому название укорачивается
+        item = escape_markdown(shorten(items[0], MESSAGE_LENGTH_LIMIT // 4))
+        return (
+            f'🛍️ *Добавить товар* "{item}" *в ваш список покупок?*{footer}',
+            markup,
+        )
+    header = (
+        f"🛍️ *Добавить {len(items)} {plural(len(items), ITEM_FORMS)} "
+        f"в ваш список покупок?*\n"
+    )
+    # Запас под строку "…и ещё K"
+    budget = MESSAGE_LENGTH_LIMIT - len(header) - len(footer) - 20
+    lines = []
+    for item in items:
+        line = f"\n• {escape_markdown(shorten(item, LIST_ITEM_DISPLAY_LENGTH))}"
+        if len(line) > budget:
+            lines.append(f"\n…и ещё {len(items) - len(lines)}")
+            break
+        budget -= len(line)
+        lines.append(line)
+    return header + "".join(lines) + footer, markup
+
+
 # Обработка подтверждения добавления элемента
-@bot.callback_query_handler(func=lambda call: call.data in ["add_yes", "cancel"])
-def handle_add_item(call):
-    """Обрабатывает подтверждение добавления элемента."""
+@router.action("add")
+def handle_add_item(call, payload):
+    """Обрабатывает подтверждение добавления одного или нескольких товаров."""
     user_id = call.from_user.id
-    if call.data == "cancel":
-        bot.delete_state(user_id, call.message.chat.id)
-        handle_cancel_action(call)
+    with bot.retrieve_data(user_id, call.message.chat.id) as data:
+        items = data.get("items")
+    if not items:
+        bot.answer_callback_query(call.id, ADD_FAILED_MESSAGE)
         return
 
-    with bot.retrieve_data(user_id, call.message.chat.id) as data:
-        item = data.get("item")
+    add_items(call.from_user, items)
+    bot.delete_state(user_id, call.message.chat.id)
+    bot.answer_callback_query(call.id, render_added(items))
+
+    # Превращаем вопрос о добавлении в обновленный список на странице с новым товаром
+    show_list(call.message, user_id, edit=True, page=LAST_PAGE)
+
+
+ADD_FAILED_MESSAGE = "❌ Не удалось добавить продукт."
+
+
+# Добавление товаров в список группы пользователя
+def add_items(user, items):
+    """Добавляет товары и уведомления участникам группы одним коммитом."""
+    actor_name = user.first_name
+    with transaction():
+        group_id = get_or_create_group(user.id)
+        execute_many(
+            "INSERT OR IGNORE INTO lists (group_id, item) VALUES (?, ?)",
+            [(group_id, item) for item in items],
+        )
+        history.record(group_id, items)
+        bump_list_version(group_id)
+        notify_group_users_many(
+            group_id,
+            [
+                (
+                    f'🛒 *{escape_markdown(actor_name)}* добавил товар "*{escape_markdown(item)}*" в список покупок!',
+                    item,
+                )
+                for item in items
+            ],
+            user.id,
+            kind="add",
+            actor_name=actor_name,
+        )
+
+
+def render_added(items):
+    if len(items) == 1:
+        return f'✅ "{shorten(items[0], 150)}" добавлен в список.'
+    return f"✅ В список добавлено {len(items)} {plural(len(items), ITEM_FORMS)}."
+
+
+# Добавление подсказки из истории одним нажатием
+@router.action("hist")
+def handle_history_item(call, history_id):
+    user_id = call.from_user.id
+    item = add_history_item(call.from_user, history_id)
     if not item:
-        bot.answer_callback_query(call.id, "❌ Не удалось добавить продукт.")
+        bot.answer_callback_query(call.id, ITEM_NOT_FOUND_MESSAGE)
         return
 
-    group_id = get_or_create_group(user_id)
+    bot.delete_state(user_id, call.message.chat.id)
+    bot.answer_callback_query(call.id, render_added([item]))
+    show_list(call.message, user_id, edit=True, page=LAST_PAGE)
 
-    send_typing_action(call.message.chat.id)
 
-    # Добавляем элемент в список группы
-    execute_query(
-        "INSERT OR IGNORE INTO lists (group_id, item) VALUES (?, ?)", (group_id, item)
-    )
+def add_history_item(user, history_id):
+    """Возвращает название добавленного товара или None, если его нет в истории."""
+    with transaction():
+        item = history.get(get_or_create_group(user.id), history_id)
+        if item:
+            add_items(user, [item])
+        return item
 
-    # Уведомляем участников группы
-    notify_group_users(
-        group_id,
-        f'🛒 *{escape_markdown(call.from_user.first_name)}* добавил товар "*{escape_markdown(item)}*" в список покупок!',
-        user_id,
-    )
 
-    bot.answer_callback_query(call.id, f'✅ "{item}" добавлен в список.')
-    bot.edit_message_text(
-        chat_id=call.message.chat.id,
-        message_id=call.message.message_id,
-        text=f'✅ Товар *"{escape_markdown(item)}"* успешно добавлен в ваш список покупок!',
-        parse_mode="Markdown",
-    )
+# Возврат в список товаров, добавленных за последнюю неделю
+@router.action("repeat")
+def handle_repeat(call, payload):
+    user_id = call.from_user.id
+    items = add_recent_items(call.from_user)
+    if not items:
+        bot.answer_callback_query(call.id, NOTHING_TO_REPEAT_MESSAGE)
+        return
+
+    bot.delete_state(user_id, call.message.chat.id)
+    bot.answer_callback_query(call.id, render_added(items))
+    show_list(call.message, user_id, edit=True, page=LAST_PAGE)
+
 
-    # Отображаем обновленный список покупок
-    show_list(call.message, user_id)
+NOTHING_TO_REPEAT_MESSAGE = "🤷 Все товары за неделю уже в списке."
+
+
+def add_recent_items(user):
+    """Добавляет товары за REPEAT_PERIOD, которых нет в списке. Возвращает их."""
+    with transaction():
+        items = history.recent(
+            get_or_create_group(user.id), REPEAT_PERIOD, MAX_ITEMS_PER_MESSAGE
+        )
+        if items:
+            add_items(user, items)
+        return items
 
 
 # Обработка удаления элемента из списка
-@bot.callback_query_handler(func=lambda call: call.data.startswith("delete_"))
-def delete_item(call):
+@router.action("delete")
+def delete_item(call, item_id):
     """Удаляет элемент из списка группы."""
-    item_id = call.data.split("_", 1)[1]
-    user_id = call.from_user.id
-    group_id = get_or_create_group(user_id)
-
-    # Получаем название элемента перед удалением
-    item = execute_query(
-        "SELECT item FROM lists WHERE item_id = ? AND group_id = ?",
-        (item_id, group_id),
-        fetchone=True,
-    )
+    item = remove_item(call.from_user, item_id)
     if not item:
-        bot.answer_callback_query(call.id, "❌ Элемент не найден.")
+        bot.answer_callback_query(call.id, ITEM_NOT_FOUND_MESSAGE)
         return
-    item = item[0]
 
-    send_typing_action(call.message.chat.id)
+    bot.answer_callback_query(call.id, render_deleted(item))
+
+    # Обновляем список в том же сообщении, оставаясь на той же странице
+    show_list(call.message, call.from_user.id, edit=True, page=None)
+
+
+ITEM_NOT_FOUND_MESSAGE = "❌ Элемент не найден."
+
+
+# Ответ на нажатие укладывается в 200 символов answerCallbackQuery
+def render_deleted(item):
+    return f'🗑️ "{shorten(item, 150)}" удален из списка.'
+
+
+# Удаление товара из списка группы пользователя
+def remove_item(user, item_id):
+    """Возвращает название удаленного товара или None, если его нет в списке."""
+    with transaction():
+        group_id = get_or_create_group(user.id)
 
-    # Удаляем элемент из списка группы
+        # Получаем название элемента перед удалением
+        item = execute_query(
+            "SELECT item FROM lists WHERE item_id = ? AND group_id = ?",
+            (item_id, group_id),
+            fetchone=True,
+        )
+        if not item:
+            return None
+        item = item[0]
+        # Удаляем элемент и уведомляем участников группы одним коммитом
+        execute_query(
+            "DELETE FROM lists WHERE item_id = ? AND group_id = ?",
+            (item_id, group_id),
+        )
+        bump_list_version(group_id)
+        notify_group_users(
+            group_id,
+            f'🗑️ *{escape_markdown(user.first_name)}* удалил товар "*{escape_markdown(item)}*" из списка покупок.',
+            user.id,
+            kind="delete",
+            actor_name=user.first_name,
+            item=item,
+        )
+        return item
+
+
+# Версия списка группы: увеличивается при каждом изменении списка
+def bump_list_version(group_id):
+    """Вызывайте в той же транзакции, что и изменение списка."""
     execute_query(
-        "DELETE FROM lists WHERE item_id = ? AND group_id = ?", (item_id, group_id)
+        "UPDATE groups SET version = version + 1 WHERE group_id = ?", (group_id,)
     )
 
-    # Уведомляем участников группы
-    notify_group_users(
-        group_id,
-        f'🗑️ *{escape_markdown(call.from_user.first_name)}* удалил товар "*{escape_markdown(item)}*" из списка покупок.',
-        user_id,
+
+# Отрисованные страницы списков по ключу (group_id, version, page)
+render_cache = LRUCache(RENDER_CACHE_SIZE)
+
+# Номер страницы, означающий последнюю страницу списка
+LAST_PAGE = -1
+
+
+# Укорачивание длинных названий для отображения
+def shorten(text, limit):
+    return text if len(text) <= limit else text[: limit - 1] + "…"
+
+
+# Текст и кнопки одной страницы списка покупок
+def render_list(items, total, page, pages):
+    """Возвращает текст страницы со списком и клавиатуру с кнопками удаления и листания."""
+    markup = types.InlineKeyboardMarkup()
+    if not items:
+        return (
+            "🛒 *Ваш список покупок пуст.*\n\nДобавьте товары, отправив их названия сообщением.",
+            markup,
+        )
+
+    lines = []
+    for item_id, item in items:
+        lines.append(f"• {escape_markdown(shorten(item, LIST_ITEM_DISPLAY_LENGTH))}")
+        # Добавляем кнопку удаления для каждого элемента
+        button = types.InlineKeyboardButton(
+            text=f"❌ {shorten(item, 40)}",
+            callback_data=callback_data("delete", item_id),
+        )
+        markup.add(button)
+    if pages > 1:
+        navigation = []
+        if page > 0:
+            navigation.append(
+                types.InlineKeyboardButton(
+                    "⬅️ Назад", callback_data=callback_data("page", page - 1)
+                )
+            )
+        navigation.append(
+            types.InlineKeyboardButton(
+                f"{page + 1}/{pages}", callback_data=callback_data("page", page)
+            )
+        )
+        if page < pages - 1:
+            navigation.append(
+                types.InlineKeyboardButton(
+                    "Вперед ➡️", callback_data=callback_data("page", page + 1)
+                )
+            )
+        markup.row(*navigation)
+    item_list = "\n".join(lines)
+    page_info = f", стр. {page + 1}/{pages}" if pages > 1 else ""
+    return (
+        f"🛒 *Ваш список покупок* ({total} {plural(total, ITEM_FORMS)}{page_info}):\n"
+        "--------------------------------------\n"
+        f"{item_list}\n"
+        "--------------------------------------",
+        markup,
     )
 
-    bot.answer_callback_query(call.id, "🗑️ Элемент удален.")
-    send_markdown_message(
-        call.message.chat.id,
-        f'🗑️ Товар *"{escape_markdown(item)}"* был удален из вашего списка покупок.',
+
+def get_rendered_list(group_id, page=0):
+    """Возвращает (текст, клавиатура, есть ли товары, номер страницы).
+
+    Из базы читаются только товары запрошенной страницы. Результат кэшируется
+    по версии списка, номер страницы приводится к допустимому диапазону.
+    """
+    version = execute_query(
+        "SELECT version FROM groups WHERE group_id = ?", (group_id,), fetchone=True
     )
+    key = (group_id, version[0] if version else 0, page)
+    rendered = render_cache.get(key)
+    if rendered is None:
+        total = execute_query(
+            "SELECT COUNT(*) FROM lists WHERE group_id = ?", (group_id,), fetchone=True
+        )[0]
+        pages = max(1, -(-total // LIST_PAGE_SIZE))
+        current = pages - 1 if page == LAST_PAGE else min(max(page, 0), pages - 1)
+        # Получаем элементы только текущей страницы
+        items = execute_query(
+            """
+            SELECT item_id, item FROM lists WHERE group_id = ?
+            ORDER BY item_id LIMIT ? OFFSET ?
+        """,
+            (group_id, LIST_PAGE_SIZE, current * LIST_PAGE_SIZE),
+            fetch=True,
+        )
+        rendered = (*render_list(items, total, current, pages), total > 0, current)
+        render_cache.put(key, rendered)
+    return rendered
 
-    # Отображаем обновленный список покупок
-    show_list(call.message, user_id)
 
+# Живое сообщение со списком: одно на чат, обновляется редактированием
+def get_live_message(chat_id):
+    """Возвращает (message_id, menu_has_items, page) живого сообщения чата."""
+    return execute_query(
+        "SELECT message_id, menu_has_items, page FROM live_messages WHERE chat_id = ?",
+        (chat_id,),
+        fetchone=True,
+    ) or (None, None, 0)
 
-# Отображение списка покупок
-@bot.message_handler(func=lambda message: message.text == SHOPPING_LIST)
-def show_list(message, user_id=None):
-    if user_id is None:
-        user_id = message.from_user.id
-    group_id = get_or_create_group(user_id)
 
-    # Получаем элементы списка группы
-    items = execute_query(
-        """SELECT item_id, item FROM lists WHERE group_id = ?""",
-        (group_id,),
-        fetch=True,
+def save_live_message(chat_id, message_id, menu_has_items, page):
+    execute_query(
+        """
+        INSERT OR REPLACE INTO live_messages (chat_id, message_id, menu_has_items, page)
+        VALUES (?, ?, ?, ?)
+    """,
+        (chat_id, message_id, menu_has_items, page),
     )
 
-    if items:
-        item_list = ""
-        markup = types.InlineKeyboardMarkup()
-        for idx, (item_id, item) in enumerate(items, 1):
-            item_text = f"• {escape_markdown(item)}"
-            item_list += item_text + "\n"
-            # Добавляем кнопку удаления для каждого элемента
-            button = types.InlineKeyboardButton(
-                text=f"❌ {item}", callback_data=f"delete_{item_id}"
-            )
-            markup.add(button)
 
+# Отображение списка покупок
+@router.text(SHOPPING_LIST)
+def show_list(message, user_id=None, edit=False, page=0):
+    """Показывает страницу списка покупок в живом сообщении чата.
+
+    С edit=True сообщение message (то, под которым нажали кнопку) редактируется
+    и становится живым, иначе отправляется новое. Предыдущее живое сообщение
+    удаляется, чтобы в чате оставался один актуальный список. page=None
+    оставляет страницу, открытую в живом сообщении, LAST_PAGE - последняя.
+    """
+    if user_id is None:
+        user_id = message.from_user.id
+    chat_id = message.chat.id
+    live, rendered = load_list_view(chat_id, user_id, page)
+    live_id, menu_has_items, live_page = live
+    text, markup, has_items, page = rendered
+
+    message_id = None
+    if edit and edit_markdown_message(chat_id, message.message_id, text, markup):
+        message_id = message.message_id
+    if message_id is None:
+        message_id = send_markdown_message(
+            chat_id, text, reply_markup=markup
+        ).message_id
+    if live_id and live_id != message_id:
+        delete_message_quietly(chat_id, live_id)
+
+    # Обычную клавиатуру нельзя прикрепить к редактируемому сообщению, поэтому
+    # главное меню отправляем отдельно и только когда меняется набор кнопок
+    if menu_has_items is None or bool(menu_has_items) != has_items:
         send_markdown_message(
-            message.chat.id,
-            f"🛒 *Ваш список покупок* ({len(items)} товаров):\n"
-            "--------------------------------------\n"
-            f"{item_list}"
-            "--------------------------------------",
-            reply_markup=markup,
-        )
-    else:
-        send_markdown_message(
-            message.chat.id,
-            "🛒 *Ваш список покупок пуст.*\n\nДобавьте товары, отправив их названия сообщением.",
+            chat_id,
+            MENU_PROMPT,
+            reply_markup=main_menu(has_items=has_items),
         )
+    if (live_id, menu_has_items, live_page) != (message_id, has_items, page):
+        save_live_message(chat_id, message_id, has_items, page)
 
-    # Отображаем главное меню
-    send_markdown_message(
-        message.chat.id,
-        "🔖 *Выберите действие из меню ниже или добавьте новый товар:*",
-        reply_markup=main_menu(has_items=bool(items)),
-    )
+
+MENU_PROMPT = "🔖 *Выберите действие из меню ниже или добавьте новый товар:*"
+
+
+# Данные для показа списка: живое сообщение чата и нужная страница
+def load_list_view(chat_id, user_id, page):
+    """Возвращает (живое сообщение, отрисованная страница) для show_list."""
+    group_id = get_or_create_group(user_id)
+    live = get_live_message(chat_id)
+    return live, get_rendered_list(group_id, live[2] if page is None else page)
+
+
+# Номер страницы из кнопки или None, если кнопка устарела или подделана
+def parse_page(payload):
+    try:
+        return int(payload)
+    except (TypeError, ValueError):
+        return None
+
+
+# Листание страниц списка
+@router.action("page")
+def change_page(call, page):
+    """Показывает выбранную страницу списка в том же сообщении."""
+    page = parse_page(page)
+    if page is None:
+        bot.answer_callback_query(call.id, ITEM_NOT_FOUND_MESSAGE)
+        return
+    bot.answer_callback_query(call.id)
+    show_list(call.message, call.from_user.id, edit=True, page=page)
 
 
 # Подтверждение очистки списка
-@bot.message_handler(func=lambda message: message.text == CLEAR_LIST)
+@router.text(CLEAR_LIST)
 def confirm_clear_list(message):
     """Запрашивает подтверждение перед очисткой списка."""
-    buttons = [
-        ("✅ Да, очистить", "confirm_clear"),
-        ("❌ Отмена", "cancel"),
-    ]
-    prompt_user(
-        message.chat.id,
-        "🗑️ *Вы уверены, что хотите полностью очистить ваш список покупок?*",
-        buttons,
-    )
+    prompt_user(message.chat.id, CLEAR_PROMPT, CLEAR_BUTTONS)
 
 
-@bot.callback_query_handler(func=lambda call: call.data == "confirm_clear")
-def clear_list(call):
-    """Очищает список группы после подтверждения."""
-    user_id = call.from_user.id
-    group_id = get_or_create_group(user_id)
+CLEAR_PROMPT = "🗑️ *Вы уверены, что хотите полностью очистить ваш список покупок?*"
+CLEAR_BUTTONS = [
+    ("✅ Да, очистить", callback_data("clear")),
+    ("❌ Отмена", callback_data("cancel")),
+]
 
-    send_typing_action(call.message.chat.id)
 
-    # Очищаем список группы
-    execute_query("DELETE FROM lists WHERE group_id = ?", (group_id,))
+@router.action("clear")
+def clear_list(call, payload):
+    """Очищает список группы после подтверждения."""
+    clear_group_list(call.from_user)
     bot.answer_callback_query(call.id, "🗑️ Список очищен.")
-    send_markdown_message(
-        call.message.chat.id,
-        "🗑️ *Ваш список покупок был успешно очищен!*",
-        reply_markup=main_menu(has_items=False),
-    )
-
-    # Уведомляем участников группы
-    notify_group_users(
-        group_id,
-        f"🗑️ *{escape_markdown(call.from_user.first_name)}* очистил список покупок!",
-        user_id,
-    )
+    show_list(call.message, call.from_user.id, edit=True)
+
+
+# Очистка списка группы пользователя
+def clear_group_list(user):
+    """Очищает список группы и уведомляет участников одним коммитом."""
+    with transaction():
+        group_id = get_or_create_group(user.id)
+        execute_query("DELETE FROM lists WHERE group_id = ?", (group_id,))
+        bump_list_version(group_id)
+        # Уведомления о товарах, которых больше нет в списке, уже не нужны
+        outbox.cancel(group_id, ("add", "delete"))
+        notify_group_users(
+            group_id,
+            f"🗑️ *{escape_markdown(user.first_name)}* очистил список покупок!",
+            user.id,
+            kind="clear",
+            actor_name=user.first_name,
+        )
 
 
 # Универсальный обработчик отмены действия
@@ -504,67 +1149,68 @@ def handle_cancel_action(call):
     bot.answer_callback_query(call.id, "🔙 Действие отменено.")
     send_markdown_message(
         call.message.chat.id,
-        "🔙 *Действие отменено.*",
+        CANCELLED_MESSAGE,
     )
 
 
-# Регистрируем обработчик для всех случаев, когда data == "cancel"
-@bot.callback_query_handler(func=lambda call: call.data == "cancel")
-def cancel_action(call):
+CANCELLED_MESSAGE = "🔙 *Действие отменено.*"
+
+
+# Отмена добавления товаров или очистки списка
+@router.action("cancel")
+def cancel_action(call, payload):
+    bot.delete_state(call.from_user.id, call.message.chat.id)
     handle_cancel_action(call)
 
 
 # Информация о приложении
-@bot.message_handler(func=lambda message: message.text == ABOUT_APP)
+@router.text(ABOUT_APP)
 def about_app(message):
     """Предоставляет информацию о приложении."""
     send_markdown_message(
         message.chat.id,
-        "ℹ️ *О приложении*\n\n"
-        "🤖 *ShopBuddy* - ваш надежный помощник в управлении списками покупок!\n\n"
-        "С помощью меня вы можете:\n"
-        "• 📝 Легко добавлять товары в список.\n"
-        "• ❌ Удалять товары одним нажатием.\n"
-        "• 🤝 Делиться списком с близкими и друзьями.\n"
-        "• 👤 Просматривать участников списка.\n\n"
-        "Просто начните вводить названия товаров, и я помогу вам их сохранить!",
+        ABOUT_MESSAGE,
     )
 
 
+ABOUT_MESSAGE = (
+    "ℹ️ *О приложении*\n\n"
+    "🤖 *ShopBuddy* - ваш надежный помощник в управлении списками покупок!\n\n"
+    "С помощью меня вы можете:\n"
+    "• 📝 Легко добавлять товары в список.\n"
+    "• ❌ Удалять товары одним нажатием.\n"
+    "• 🤝 Делиться списком с близкими и друзьями.\n"
+    "• 👤 Просматривать участников списка.\n\n"
+    "Просто начните вводить названия товаров, и я помогу вам их сохранить!"
+)
+
+
 # Показ участников списка
-@bot.message_handler(func=lambda message: message.text == VIEW_SHARED_USERS)
+@router.text(VIEW_SHARED_USERS)
 def show_shared_users(message):
     """Показывает список пользователей, с которыми вы поделились списком."""
-    user_id = message.from_user.id
+    send_markdown_message(
+        message.chat.id,
+        render_members(message.from_user.id),
+    )
+
+
+# Текст со списком участников группы пользователя
+def render_members(user_id):
     group_id = get_or_create_group(user_id)
 
     # Получаем список пользователей в группе
-    users = execute_query(
-        """
-        SELECT u.first_name, u.username FROM user_groups ug
-        JOIN users u ON ug.user_id = u.user_id
-        WHERE ug.group_id = ?
-    """,
-        (group_id,),
-        fetch=True,
+    users = get_group_members(group_id)
+
+    if not users:
+        return "ℹ️ *Вы пока не поделились списком ни с кем.*"
+    user_list = "\n".join(
+        [
+            f"• {escape_markdown(first_name)}{' (@' + escape_markdown(username) + ')' if username else ''}"
+            for first_name, username in users
+        ]
     )
-
-    if users:
-        user_list = "\n".join(
-            [
-                f"• {escape_markdown(first_name)}{' (@' + escape_markdown(username) + ')' if username else ''}"
-                for first_name, username in users
-            ]
-        )
-        send_markdown_message(
-            message.chat.id,
-            f"👥 *Участники вашего списка покупок*:\n\n{user_list}",
-        )
-    else:
-        send_markdown_message(
-            message.chat.id,
-            "ℹ️ *Вы пока не поделились списком ни с кем.*",
-        )
+    return f"👥 *Участники вашего списка покупок*:\n\n{user_list}"
 
 
 # Функция для отправки сообщения с кнопками
@@ -0,0 +1,72 @@
+# cache.py
+
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+# Ограниченный по размеру кэш с вытеснением давно неиспользуемых записей
+class LRUCache:
+    """Потокобезопасный LRU-кэш на maxsize записей со счетчиками попаданий.
+
+    generation увеличивается при каждой инвалидации. Загрузчик запоминает его
+    до чтения из базы и передает в put: если за это время запись была
+    инвалидирована, устаревшее значение в кэш не попадет.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, generation=None):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def invalidate(self, key):
+        """Удаляет запись и не дает сохранить значения, загруженные до этого."""
+        with self._lock:
+            self._data.pop(key, None)
+            self.generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.generation += 1
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,224 @@
+# db.py
+
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+
+from config import DB_NAME
+from metrics import observe_query
+from settings import (
+    DB_BUSY_TIMEOUT,
+    DB_CACHE_SIZE_KB,
+    DB_EXECUTOR_WORKERS,
+    DB_STATEMENT_CACHE_SIZE,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# Менеджер долгоживущих соединений с базой данных
+class ConnectionManager:
+    """Держит по одному соединению на поток и переиспользует его между запросами."""
+
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Открытые соединения: идентификатор потока -> (поток, соединение)
+        self._connections = {}
+        self._wal_enabled = False
+        self.opened = 0
+        self.reused = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_name,
+            timeout=DB_BUSY_TIMEOUT,
+            # Транзакциями управляем сами, каждый одиночный запрос - автокоммит
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=DB_STATEMENT_CACHE_SIZE,
+        )
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA cache_size = -{int(DB_CACHE_SIZE_KB)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    def _prune(self):
+        """Закрывает соединения потоков, которые уже завершились."""
+        for ident, (thread, conn) in list(self._connections.items()):
+            if not thread.is_alive():
+                conn.close()
+                del self._connections[ident]
+
+    def get(self):
+        """Возвращает соединение текущего потока, открывая его при необходимости."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            self.reused += 1
+            return conn
+
+        conn = self._connect()
+        with self._lock:
+            if not self._wal_enabled:
+                # Режим WAL сохраняется в файле базы, достаточно включить его один раз.
+                # auto_vacuum действует только для новой, еще пустой базы
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                conn.execute("PRAGMA journal_mode = WAL")
+                self._wal_enabled = True
+            self._prune()
+            thread = threading.current_thread()
+            self._connections[thread.ident] = (thread, conn)
+            self.opened += 1
+        self._local.conn = conn
+        return conn
+
+    def close_all(self):
+        """Закрывает все открытые соединения (например, при остановке бота)."""
+        with self._lock:
+            for _, conn in self._connections.values():
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    def stats(self):
+        return {
+            "connections_opened": self.opened,
+            "connections_reused": self.reused,
+            "connections_open": len(self._connections),
+        }
+
+
+connections = ConnectionManager(DB_NAME)
+
+
+def stats():
+    """Счетчики открытых и переиспользованных соединений."""
+    return connections.stats()
+
+
+# Функция для выполнения запросов к базе данных
+def execute_query(
+    query, params=(), fetch=False, fetchone=False, lastrowid=False, rowcount=False
+):
+    started = time.perf_counter()
+    try:
+        cursor = connections.get().execute(query, params)
+        try:
+            if lastrowid:
+                return cursor.lastrowid
+            elif rowcount:
+                return cursor.rowcount
+            elif fetchone:
+                return cursor.fetchone()
+            elif fetch:
+                return cursor.fetchall()
+            return None
+        finally:
+            cursor.close()
+            observe_query(query, time.perf_counter() - started)
+    except sqlite3.Error as e:
+        logger.error(f"Ошибка базы данных: {e}")
+        raise
+
+
+# Выполнение одного запроса для множества наборов параметров
+def execute_many(query, seq_of_params):
+    """Выполняет запрос для каждого набора параметров. Возвращает число
+    измененных строк."""
+    started = time.perf_counter()
+    try:
+        return connections.get().executemany(query, seq_of_params).rowcount
+    except sqlite3.Error as e:
+        logger.error(f"Ошибка базы данных: {e}")
+        raise
+    finally:
+        observe_query(query, time.perf_counter() - started)
+
+
+# Единица работы: несколько запросов в одной транзакции
+@contextmanager
+def transaction():
+    """Выполняет все запросы блока в одной транзакции с одним коммитом.
+
+    Вызовы execute_query внутри блока используют то же соединение и
+    становятся частью транзакции. Вложенные блоки присоединяются к внешнему.
+    """
+    conn = connections.get()
+    if conn.in_transaction:
+        yield conn
+        return
+    # IMMEDIATE сразу берет блокировку на запись и не дает транзакции
+    # упасть с SQLITE_BUSY при переходе от чтения к записи. Список
+    # callback-ов заводится только после успешного BEGIN: если база занята,
+    # он не должен остаться в потоке и поглощать вызовы after_commit
+    conn.execute("BEGIN IMMEDIATE")
+    callbacks = connections._local.after_commit = []
+    try:
+        yield conn
+        # Коммит в режиме WAL - запись в журнал, его время тоже учитываем
+        started = time.perf_counter()
+        conn.execute("COMMIT")
+        observe_query("COMMIT", time.perf_counter() - started)
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        connections._local.after_commit = None
+    for callback in callbacks:
+        try:
+            callback()
+        except Exception:
+            logger.exception("Ошибка в обработчике after_commit")
+
+
+def after_commit(callback):
+    """Вызывает callback после коммита текущей транзакции (или сразу, если ее нет).
+
+    При откате транзакции callback не вызывается.
+    """
+    callbacks = getattr(connections._local, "after_commit", None)
+    if callbacks is None:
+        callback()
+    else:
+        callbacks.append(callback)
+
+
+# Пул потоков для работы с базой из asyncio. Создается при первом обращении
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db"
+            )
+        return _executor
+
+
+async def run_in_db(func, *args, **kwargs):
+    """Выполняет func(*args, **kwargs) в пуле потоков базы, не блокируя цикл событий.
+
+    Вся синхронная работа с базой (execute_query, transaction и функции,
+    которые их вызывают) из корутин должна идти через run_in_db.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor(), partial(func, *args, **kwargs))
+
+
+def shutdown_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
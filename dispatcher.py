@@ -0,0 +1,145 @@
+# dispatcher.py
+"""Обработка обновлений в нескольких процессах (python main.py --workers N).
+
+Главный процесс получает обновления (long polling или webhook) и раздает их
+рабочим процессам. Обновления участников одной группы всегда попадают в один
+процесс и обрабатываются строго по порядку, поэтому изменения одного списка
+не выполняются параллельно. Пользователи без группы распределяются по id.
+
+Рабочие процессы только обрабатывают обновления и пишут уведомления в
+outbox; доставляет их главный процесс.
+"""
+
+import logging
+import multiprocessing
+import signal
+import threading
+import time
+
+from telebot import apihelper, types
+
+from db import execute_query
+from settings import METRICS_HOST, METRICS_PORT
+from webhook import update_key
+
+logger = logging.getLogger(__name__)
+
+
+# Цикл рабочего процесса
+def worker_main(index, updates, processed):
+    # Ctrl+C получает вся группа процессов. Рабочий процесс не прерывается,
+    # а дорабатывает очередь до маркера остановки от главного процесса
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import bot
+    import db
+
+    bot.bot.threaded = False
+    bot.outbox_sender.autostart = False
+    if METRICS_PORT:
+        from metrics import MetricsServer
+
+        MetricsServer(METRICS_HOST, METRICS_PORT + 1 + index).start()
+    try:
+        while True:
+            update = updates.get()
+            if update is None:
+                return
+            try:
+                # Членство могли изменить другие процессы. Обновление пришло
+                # сюда по группе, найденной после коммита изменения, поэтому
+                # одной проверки перед обработкой достаточно
+                bot.sync_membership_caches()
+                bot.bot.process_new_updates([types.Update.de_json(update)])
+            except Exception:
+                logger.exception(
+                    f"Ошибка обработки обновления {update.get('update_id')}"
+                )
+            with processed.get_lock():
+                processed.value += 1
+    finally:
+        db.connections.close_all()
+
+
+# Номер процесса, который обрабатывает обновление
+def shard_key(update):
+    """Возвращает ключ группы отправителя или, если группы нет, его id."""
+    user_id = update_key(update)
+    group = execute_query(
+        "SELECT group_id FROM user_groups WHERE user_id = ?", (user_id,), fetchone=True
+    )
+    return ("group", group[0]) if group else ("user", user_id)
+
+
+class Dispatcher:
+    """Раздает обновления рабочим процессам по ключу группы."""
+
+    def __init__(self, workers=2, queue_size=1000):
+        # spawn: рабочий процесс заново импортирует бота и не наследует
+        # потоки и соединения с базой главного процесса
+        context = multiprocessing.get_context("spawn")
+        self._queues = [context.Queue(queue_size) for _ in range(max(1, workers))]
+        self._processed = [context.Value("q", 0) for _ in self._queues]
+        self._processes = [
+            context.Process(
+                target=worker_main,
+                args=(index, updates, processed),
+                name=f"worker-{index}",
+            )
+            for index, (updates, processed) in enumerate(
+                zip(self._queues, self._processed)
+            )
+        ]
+        self._stopping = threading.Event()
+        self.dispatched = [0] * len(self._queues)
+
+    def start(self):
+        for process in self._processes:
+            process.start()
+        logger.info(f"Запущено рабочих процессов: {len(self._processes)}")
+        return self
+
+    def process(self, updates):
+        """Раздает обновления (словари JSON) рабочим процессам.
+
+        Если очередь процесса заполнена, вызов ждет освобождения места.
+        """
+        for update in updates:
+            index = hash(shard_key(update)) % len(self._queues)
+            self._queues[index].put(update)
+            self.dispatched[index] += 1
+
+    def poll(self, token, timeout=20):
+        """Получает обновления через long polling до вызова stop()."""
+        offset = None
+        while not self._stopping.is_set():
+            try:
+                updates = apihelper.get_updates(
+                    token, offset=offset, limit=100, timeout=timeout
+                )
+            except Exception:
+                logger.exception("Ошибка получения обновлений")
+                self._stopping.wait(3)
+                continue
+            if updates:
+                self.process(updates)
+                offset = updates[-1]["update_id"] + 1
+
+    def stop(self, timeout=30):
+        """Дорабатывает уже розданные обновления и останавливает процессы."""
+        self._stopping.set()
+        for updates in self._queues:
+            updates.put(None)
+        deadline = time.monotonic() + timeout
+        for process in self._processes:
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning(f"Процесс {process.name} не завершился, останавливаем")
+                process.terminate()
+                process.join()
+
+    def stats(self):
+        return {
+            "workers": len(self._processes),
+            "dispatched": list(self.dispatched),
+            "processed": [processed.value for processed in self._processed],
+        }
@@ -0,0 +1,90 @@
+# history.py
+"""История покупок группы для подсказок при добавлении товаров.
+
+Каждый добавленный товар записывается в item_history один раз на группу:
+нормализованное название (без регистра и лишних пробелов), последнее
+написание, число добавлений и время последнего добавления. Поиск по началу
+названия идет по уникальному индексу (group_id, norm) диапазоном
+norm >= префикс AND norm < префикс + максимальный символ, поэтому не зависит
+от того, сколько лет накапливалась история.
+"""
+
+import time
+
+from db import execute_many, execute_query
+
+# Символ больше любого другого: верхняя граница диапазона для поиска по префиксу
+PREFIX_END = "\U0010ffff"
+
+
+# Нормализованное название товара для поиска и объединения написаний
+def normalize_item(item):
+    return " ".join(item.split()).casefold()
+
+
+def record(group_id, items):
+    """Учитывает добавление товаров. Вызывайте в транзакции добавления."""
+    now = time.time()
+    execute_many(
+        """
+        INSERT INTO item_history (group_id, norm, item, freq, last_used)
+        VALUES (?, ?, ?, 1, ?)
+        ON CONFLICT (group_id, norm) DO UPDATE SET
+            item = excluded.item,
+            freq = freq + 1,
+            last_used = excluded.last_used
+    """,
+        [(group_id, normalize_item(item), item, now) for item in items],
+    )
+
+
+def suggest(group_id, prefix, limit):
+    """Возвращает до limit [(history_id, товар), ...], начинающихся с prefix.
+
+    Сначала самые частые. Товары, которые уже есть в списке, и сам prefix
+    как целое название пропускаются.
+    """
+    norm = normalize_item(prefix)
+    if not norm or not limit:
+        return []
+    return execute_query(
+        """
+        SELECT history_id, item FROM item_history h
+        WHERE group_id = ? AND norm >= ? AND norm < ? AND norm != ?
+            AND NOT EXISTS (
+                SELECT 1 FROM lists l WHERE l.group_id = h.group_id AND l.item = h.item
+            )
+        ORDER BY freq DESC, last_used DESC
+        LIMIT ?
+    """,
+        (group_id, norm, norm + PREFIX_END, norm, limit),
+        fetch=True,
+    )
+
+
+def get(group_id, history_id):
+    """Название товара из истории группы или None."""
+    row = execute_query(
+        "SELECT item FROM item_history WHERE history_id = ? AND group_id = ?",
+        (history_id, group_id),
+        fetchone=True,
+    )
+    return row[0] if row else None
+
+
+def recent(group_id, period, limit):
+    """Товары, добавленные за последние period секунд и уже удаленные из списка."""
+    rows = execute_query(
+        """
+        SELECT item FROM item_history h
+        WHERE group_id = ? AND last_used >= ?
+            AND NOT EXISTS (
+                SELECT 1 FROM lists l WHERE l.group_id = h.group_id AND l.item = h.item
+            )
+        ORDER BY last_used
+        LIMIT ?
+    """,
+        (group_id, time.time() - period, limit),
+        fetch=True,
+    )
+    return [row[0] for row in rows]
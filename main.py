@@ -1,10 +1,166 @@
-def start_bot():
+import argparse
+import secrets
+
+from settings import (
+    DISPATCH_QUEUE_SIZE,
+    METRICS_HOST,
+    METRICS_PORT,
+    WEBHOOK_HOST,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_QUEUE_SIZE,
+    WEBHOOK_SECRET,
+    WEBHOOK_URL,
+    WEBHOOK_WORKERS,
+    WORKER_PROCESSES,
+)
+
+
+# Секретный токен, которым Telegram подписывает запросы webhook
+def webhook_secret():
+    """WEBHOOK_SECRET, а если он не задан, но webhook регистрирует сам бот, -
+    случайный токен на время работы процесса."""
+    if WEBHOOK_SECRET:
+        return WEBHOOK_SECRET
+    if WEBHOOK_URL:
+        return secrets.token_urlsafe(32)
+    raise SystemExit(
+        "Для --webhook задайте WEBHOOK_SECRET в config.py: без него сервер "
+        "принимает обновления от кого угодно"
+    )
+
+
+# Прием обновлений через webhook
+def run_webhook(bot, secret, dispatcher=None):
+    from webhook import WebhookServer
+
+    if dispatcher:
+        # Одного потока достаточно, чтобы раздавать обновления по процессам
+        # в порядке поступления
+        process, decode, workers = dispatcher.process, False, 1
+    else:
+        # Порядок и параллельность обработки задает пул сервера
+        bot.bot.threaded = False
+        process, decode, workers = bot.bot.process_new_updates, True, WEBHOOK_WORKERS
+    server = WebhookServer(
+        process,
+        host=WEBHOOK_HOST,
+        port=WEBHOOK_PORT,
+        path=WEBHOOK_PATH,
+        secret_token=secret,
+        workers=workers,
+        queue_size=WEBHOOK_QUEUE_SIZE,
+        decode=decode,
+    ).start()
+    if WEBHOOK_URL:
+        bot.bot.set_webhook(url=WEBHOOK_URL, secret_token=secret)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop(timeout=10)
+        print(f"Статистика webhook: {server.stats()}")
+
+
+# Прием обновлений через long polling
+def run_polling(bot, dispatcher=None):
+    if WEBHOOK_URL:
+        # Telegram не отдает обновления через getUpdates, пока задан webhook
+        bot.bot.remove_webhook()
+    if dispatcher:
+        try:
+            dispatcher.poll(bot.bot.token)
+        except KeyboardInterrupt:
+            pass
+    else:
+        bot.bot.polling()
+
+
+# Асинхронный режим на AsyncTeleBot
+def run_async():
+    import asyncio
+
+    import async_bot
+    import db
+
+    try:
+        asyncio.run(async_bot.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        db.shutdown_executor()
+
+
+def start_bot(webhook=False, use_async=False, workers=1):
+    # Ошибку настройки показываем до запуска фоновых задач
+    secret = webhook_secret() if webhook and not use_async else None
     print("Запуск бота...")
+    import backup
     import bot
+    import db
 
     bot.create_tables()
-    bot.bot.polling()
+    bot.notifier.start()
+    bot.outbox_sender.start()
+    bot.state_sweeper.start()
+    bot.maintenance_task.start()
+    backup.backup_task.start()
+    if METRICS_PORT:
+        from metrics import MetricsServer
+
+        MetricsServer(METRICS_HOST, METRICS_PORT).start()
+    dispatcher = None
+    try:
+        if use_async:
+            run_async()
+        else:
+            if workers > 1:
+                from dispatcher import Dispatcher
+
+                dispatcher = Dispatcher(workers, DISPATCH_QUEUE_SIZE).start()
+            if webhook:
+                run_webhook(bot, secret, dispatcher)
+            else:
+                run_polling(bot, dispatcher)
+    finally:
+        if dispatcher:
+            # Рабочие процессы дорабатывают уже полученные обновления
+            dispatcher.stop(timeout=30)
+            print(f"Статистика рабочих процессов: {dispatcher.stats()}")
+        # Даем досылке уведомлений немного времени перед выходом. Все, что
+        # не успеет уйти, останется в outbox и будет отправлено после запуска
+        bot.state_sweeper.stop(timeout=5)
+        bot.maintenance_task.stop(timeout=5)
+        backup.backup_task.stop(timeout=60)
+        bot.outbox_sender.stop(timeout=5)
+        bot.notifier.stop(timeout=10)
+        print(f"Статистика маршрутов: {bot.router.stats()}")
+        print(f"Статистика outbox: {bot.outbox_sender.stats()}")
+        print(f"Статистика рассылки: {bot.notifier.stats()}")
+        print(f"Статистика уборки: {bot.garbage_collector.stats()}")
+        print(f"Статистика соединений с БД: {db.stats()}")
+        db.connections.close_all()
 
 
 if __name__ == "__main__":
-    start_bot()
+    parser = argparse.ArgumentParser(description="ShopBuddy Bot")
+    parser.add_argument(
+        "--webhook",
+        action="store_true",
+        help="принимать обновления через webhook вместо long polling",
+    )
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="обрабатывать обновления в asyncio на AsyncTeleBot",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=WORKER_PROCESSES,
+        help="число процессов, обрабатывающих обновления",
+    )
+    args = parser.parse_args()
+    start_bot(webhook=args.webhook, use_async=args.use_async, workers=args.workers)
@@ -0,0 +1,201 @@
+# maintenance.py
+"""Фоновая уборка базы данных.
+
+Пользователь, который переходит в другую группу, оставляет старую группу
+без участников: ее строка в groups, товары в lists и история покупок больше
+никому не видны. Коды приглашения живут SHARE_CODE_TTL секунд с момента
+выдачи. Уборщик периодически удаляет группы без участников вместе с
+товарами и историей, стирает просроченные коды и возвращает освободившиеся
+страницы файлу базы (PRAGMA incremental_vacuum). Все удаления идут
+небольшими порциями, каждая в своей короткой транзакции, чтобы не
+задерживать обработку обновлений.
+"""
+
+import logging
+import threading
+import time
+
+from db import connections, execute_query, transaction
+from metrics import registry
+from settings import GC_BATCH_SIZE, GC_VACUUM_PAGES, SHARE_CODE_TTL
+
+logger = logging.getLogger(__name__)
+
+GC_ROWS = registry.counter(
+    "shopbot_gc_rows_total", "Строки, удаленные фоновой уборкой", ("kind",)
+)
+
+
+class GarbageCollector:
+    """Удаляет недоступные данные порциями; run() выполняет один проход.
+
+    on_groups_deleted(group_ids) вызывается внутри транзакции удаления,
+    например чтобы сбросить кэши членства.
+    """
+
+    def __init__(
+        self,
+        batch_size=GC_BATCH_SIZE,
+        share_code_ttl=SHARE_CODE_TTL,
+        vacuum_pages=GC_VACUUM_PAGES,
+        on_groups_deleted=None,
+    ):
+        self.batch_size = batch_size
+        self.share_code_ttl = share_code_ttl
+        self.vacuum_pages = vacuum_pages
+        self.on_groups_deleted = on_groups_deleted
+        self._lock = threading.Lock()
+        self._vacuum_warned = False
+        self.runs = 0
+        self.groups_deleted = 0
+        self.items_deleted = 0
+        self.share_codes_expired = 0
+        self.pages_vacuumed = 0
+        self.last_run_seconds = 0.0
+
+    def run(self):
+        started = time.perf_counter()
+        groups, items = self.delete_orphan_groups()
+        codes = self.expire_share_codes()
+        pages = self.vacuum()
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.runs += 1
+            self.groups_deleted += groups
+            self.items_deleted += items
+            self.share_codes_expired += codes
+            self.pages_vacuumed += pages
+            self.last_run_seconds = elapsed
+        if groups or codes or pages:
+            logger.info(
+                f"Уборка за {elapsed:.2f} с: групп {groups}, товаров {items}, "
+                f"кодов {codes}, страниц {pages}"
+            )
+
+    def delete_orphan_groups(self):
+        """Удаляет группы без участников и их товары.
+
+        Кандидаты ищутся без блокировки записи, по порядку group_id порциями
+        по batch_size; транзакция открывается только для найденных.
+        Возвращает (число групп, число товаров).
+        """
+        groups = items = 0
+        last_group_id = 0
+        while True:
+            batch = execute_query(
+                """
+                SELECT group_id FROM groups g
+                WHERE group_id > ? AND NOT EXISTS (
+                    SELECT 1 FROM user_groups ug WHERE ug.group_id = g.group_id
+                )
+                ORDER BY group_id LIMIT ?
+            """,
+                (last_group_id, self.batch_size),
+                fetch=True,
+            )
+            if not batch:
+                return groups, items
+            last_group_id = batch[-1][0]
+            deleted_groups, deleted_items = self._delete_groups(
+                [row[0] for row in batch]
+            )
+            groups += deleted_groups
+            items += deleted_items
+
+    def _delete_groups(self, group_ids):
+        placeholders = ",".join("?" * len(group_ids))
+        # Участников проверяем повторно под блокировкой записи: после поиска
+        # в группу могли войти, а пока идет транзакция, никто не войдет по коду
+        with transaction():
+            orphans = [
+                row[0]
+                for row in execute_query(
+                    f"""
+                    SELECT group_id FROM groups g
+                    WHERE group_id IN ({placeholders}) AND NOT EXISTS (
+                        SELECT 1 FROM user_groups ug WHERE ug.group_id = g.group_id
+                    )
+                """,
+                    group_ids,
+                    fetch=True,
+                )
+            ]
+            if not orphans:
+                return 0, 0
+            placeholders = ",".join("?" * len(orphans))
+            items = execute_query(
+                f"DELETE FROM lists WHERE group_id IN ({placeholders})",
+                orphans,
+                rowcount=True,
+            )
+            execute_query(
+                f"DELETE FROM item_history WHERE group_id IN ({placeholders})",
+                orphans,
+            )
+            execute_query(
+                f"DELETE FROM groups WHERE group_id IN ({placeholders})", orphans
+            )
+            if self.on_groups_deleted:
+                self.on_groups_deleted(orphans)
+        GC_ROWS.inc("groups", amount=len(orphans))
+        GC_ROWS.inc("items", amount=items)
+        return len(orphans), items
+
+    def expire_share_codes(self):
+        """Стирает коды приглашения старше share_code_ttl. Возвращает их число."""
+        if not self.share_code_ttl:
+            return 0
+        expired = 0
+        while True:
+            deleted = execute_query(
+                """
+                UPDATE groups SET share_code = NULL, share_code_created_at = NULL
+                WHERE group_id IN (
+                    SELECT group_id FROM groups WHERE share_code_created_at < ? LIMIT ?
+                )
+            """,
+                (time.time() - self.share_code_ttl, self.batch_size),
+                rowcount=True,
+            )
+            expired += deleted
+            GC_ROWS.inc("share_codes", amount=deleted)
+            if deleted < self.batch_size:
+                return expired
+
+    def vacuum(self):
+        """Возвращает файлу до vacuum_pages свободных страниц. Возвращает их число.
+
+        Работает, только если база создана с auto_vacuum = INCREMENTAL. Старую
+        базу можно перевести один раз вручную, при остановленном боте:
+        sqlite3 shopbot.db "PRAGMA auto_vacuum = INCREMENTAL; VACUUM;"
+        """
+        if not self.vacuum_pages:
+            return 0
+        if execute_query("PRAGMA auto_vacuum", fetchone=True)[0] != 2:
+            if not self._vacuum_warned:
+                logger.info("auto_vacuum не INCREMENTAL, освобождение места пропущено")
+                self._vacuum_warned = True
+            return 0
+        before = execute_query("PRAGMA freelist_count", fetchone=True)[0]
+        if not before:
+            return 0
+        # execute() делает только один шаг запроса без результата, а каждый
+        # шаг incremental_vacuum освобождает одну страницу; executescript
+        # выполняет запрос до конца
+        connections.get().executescript(
+            f"PRAGMA incremental_vacuum({int(self.vacuum_pages)});"
+        )
+        pages = before - execute_query("PRAGMA freelist_count", fetchone=True)[0]
+        GC_ROWS.inc("pages", amount=pages)
+        return pages
+
+    def stats(self):
+        with self._lock:
+            return {
+                "runs": self.runs,
+                "groups_deleted": self.groups_deleted,
+                "items_deleted": self.items_deleted,
+                "share_codes_expired": self.share_codes_expired,
+                "pages_vacuumed": self.pages_vacuumed,
+                "last_run_seconds": round(self.last_run_seconds, 3),
+            }
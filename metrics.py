@@ -0,0 +1,382 @@
+# metrics.py
+"""Метрики времени работы внутри процесса и их выдача в формате Prometheus.
+
+Измеряются обработчики обновлений, SQL-запросы (по нормализованному тексту)
+и вызовы Bot API (по имени метода). Значения копятся в гистограммах с
+фиксированными границами: одно измерение стоит вызова perf_counter и
+короткой блокировки, поэтому метрики можно не выключать в продакшене.
+
+Чтобы смотреть метрики, задайте METRICS_PORT в config.py и откройте
+http://127.0.0.1:<METRICS_PORT>/metrics.
+"""
+
+import bisect
+import functools
+import inspect
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from settings import SLOW_QUERY_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин в секундах: от долей миллисекунды (SQLite) до секунд (Bot API)
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Histogram:
+    """Гистограмма одного набора меток."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+class Metric:
+    """Семейство метрик с одинаковыми именами меток."""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _samples(self):
+        with self._lock:
+            children = list(self._children.items())
+        return [
+            (tuple(zip(self.labelnames, values)), child) for values, child in children
+        ]
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        lines.extend(self._render_samples())
+        return lines
+
+
+class HistogramMetric(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return Histogram(self.buckets)
+
+    def observe(self, value, *labels):
+        self.labels(*labels).observe(value)
+
+    def total_count(self):
+        """Число измерений по всем наборам меток."""
+        return sum(child.snapshot()[2] for _, child in self._samples())
+
+    @contextmanager
+    def time(self, *labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.labels(*labels).observe(time.perf_counter() - started)
+
+    def _render_samples(self):
+        lines = []
+        for pairs, child in self._samples():
+            counts, total, count = child.snapshot()
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                le = bound if bound == "+Inf" else repr(float(bound))
+                labels = _format_labels(pairs + (("le", le),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(pairs)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(pairs)} {count}")
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class CounterMetric(Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, *labels, amount=1):
+        self.labels(*labels).inc(amount)
+
+    def _render_samples(self):
+        return [
+            f"{self.name}{_format_labels(pairs)} {child.value}"
+            for pairs, child in self._samples()
+        ]
+
+
+class GaugeCallback:
+    """Значение, которое вычисляется в момент чтения метрик."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, func):
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+
+    def render(self):
+        try:
+            value = self.func()
+        except Exception:
+            logger.exception(f"Не удалось получить значение {self.name}")
+            return []
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} gauge",
+            f"{self.name} {value}",
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), **kwargs):
+        return self.register(HistogramMetric(name, documentation, labelnames, **kwargs))
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(CounterMetric(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, func):
+        return self.register(GaugeCallback(name, documentation, func))
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HANDLER_SECONDS = registry.histogram(
+    "shopbot_handler_seconds", "Время обработки обновления", ("handler",)
+)
+SQL_SECONDS = registry.histogram(
+    "shopbot_sql_seconds", "Время выполнения SQL-запроса", ("query",)
+)
+SQL_SLOW = registry.counter(
+    "shopbot_sql_slow_total", "Запросы дольше SLOW_QUERY_THRESHOLD", ("query",)
+)
+BOT_API_SECONDS = registry.histogram(
+    "shopbot_bot_api_seconds", "Время вызова Bot API", ("method", "status")
+)
+
+
+# Нормализация текста запроса для метки: без лишних пробелов и с IN (?)
+# вместо списка параметров переменной длины
+PLACEHOLDER_LIST = re.compile(r"\bIN ?\( ?\?( ?, ?\?)* ?\)", re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=1024)
+def normalize_query(query):
+    return PLACEHOLDER_LIST.sub("IN (?)", " ".join(query.split()))
+
+
+def observe_query(query, elapsed):
+    """Записывает время SQL-запроса и логирует медленные запросы."""
+    normalized = normalize_query(query)
+    SQL_SECONDS.observe(elapsed, normalized)
+    if SLOW_QUERY_THRESHOLD is not None and elapsed >= SLOW_QUERY_THRESHOLD:
+        SQL_SLOW.inc(normalized)
+        logger.warning(f"Медленный запрос ({elapsed * 1000:.1f} мс): {normalized}")
+
+
+# Замер времени обработчика, например @timed_handler
+def timed_handler(handler):
+    """Оборачивает обработчик (обычный или корутину) замером времени."""
+    if inspect.iscoroutinefunction(handler):
+
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            with HANDLER_SECONDS.time(handler.__name__):
+                return await handler(*args, **kwargs)
+
+    else:
+
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            with HANDLER_SECONDS.time(handler.__name__):
+                return handler(*args, **kwargs)
+
+    return wrapper
+
+
+# Замер вызовов Bot API: оборачиваем функцию запроса telebot
+def instrument_bot_api():
+    """Подменяет telebot.apihelper._make_request версией с замером времени."""
+    from telebot import apihelper
+
+    make_request = apihelper._make_request
+    if getattr(make_request, "instrumented", False):
+        return
+
+    @functools.wraps(make_request)
+    def timed_request(token, method_name, *args, **kwargs):
+        started = time.perf_counter()
+        status = "error"
+        try:
+            result = make_request(token, method_name, *args, **kwargs)
+            status = "ok"
+            return result
+        finally:
+            BOT_API_SECONDS.observe(time.perf_counter() - started, method_name, status)
+
+    timed_request.instrumented = True
+    apihelper._make_request = timed_request
+
+
+def instrument_async_bot_api():
+    """То же для telebot.asyncio_helper (режим --async)."""
+    from telebot import asyncio_helper
+
+    process_request = asyncio_helper._process_request
+    if getattr(process_request, "instrumented", False):
+        return
+
+    @functools.wraps(process_request)
+    async def timed_request(token, url, *args, **kwargs):
+        started = time.perf_counter()
+        status = "error"
+        try:
+            result = await process_request(token, url, *args, **kwargs)
+            status = "ok"
+            return result
+        finally:
+            BOT_API_SECONDS.observe(time.perf_counter() - started, url, status)
+
+    timed_request.instrumented = True
+    asyncio_helper._process_request = timed_request
+
+
+# HTTP-сервер с метриками в текстовом формате Prometheus
+class MetricsServer:
+    def __init__(self, host="127.0.0.1", port=9100, registry=registry):
+        self.registry = registry
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="metrics-server", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Метрики доступны по адресу {self.address}")
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _make_handler(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                data = registry.render().encode()
+                self.send_response(200)
+                self.send_header(
+                    "Content-Type", "text/plain; version=0.0.4; charset=utf-8"
+                )
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,273 @@
+# migrations.py
+
+import logging
+import time
+
+from db import execute_many, execute_query, transaction
+from history import normalize_item
+
+logger = logging.getLogger(__name__)
+
+
+def add_column(table, column, definition):
+    """Шаг миграции: добавляет столбец, если его еще нет."""
+
+    def step():
+        columns = execute_query(f"PRAGMA table_info({table})", fetch=True)
+        if column not in {row[1] for row in columns}:
+            execute_query(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+    return step
+
+
+def backfill_item_history():
+    """Шаг миграции: заносит в историю товары, которые сейчас в списках."""
+    # Названия нормализуются в Python: lower() в SQLite не знает кириллицу
+    now = time.time()
+    execute_many(
+        """
+        INSERT OR IGNORE INTO item_history (group_id, norm, item, last_used)
+        VALUES (?, ?, ?, ?)
+    """,
+        (
+            (group_id, normalize_item(item), item, now)
+            for group_id, item in execute_query(
+                "SELECT group_id, item FROM lists", fetch=True
+            )
+        ),
+    )
+
+
+# Упорядоченный список миграций: (версия, описание, шаги).
+# Шаг - SQL-запрос или функция. Каждая миграция выполняется в одной транзакции
+# и должна быть идемпотентной, чтобы повторный запуск ничего не ломал.
+MIGRATIONS = [
+    (
+        1,
+        "Базовые таблицы",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY,
+                username TEXT,
+                first_name TEXT
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS groups (
+                group_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                group_name TEXT,
+                share_code TEXT UNIQUE
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS user_groups (
+                user_id INTEGER,
+                group_id INTEGER,
+                PRIMARY KEY (user_id, group_id),
+                FOREIGN KEY (user_id) REFERENCES users(user_id),
+                FOREIGN KEY (group_id) REFERENCES groups(group_id)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS lists (
+                item_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                group_id INTEGER,
+                item TEXT,
+                FOREIGN KEY (group_id) REFERENCES groups(group_id)
+            )
+            """,
+        ],
+    ),
+    (
+        2,
+        "Индексы для выборок по группе",
+        [
+            # Поиск по user_groups(user_id) уже покрыт первичным ключом (user_id, group_id)
+            "CREATE INDEX IF NOT EXISTS idx_user_groups_group_id ON user_groups(group_id)",
+            "CREATE INDEX IF NOT EXISTS idx_lists_group_id ON lists(group_id)",
+        ],
+    ),
+    (
+        3,
+        "Уникальность товаров в списке группы",
+        [
+            # Убираем дубликаты, накопленные до появления ограничения
+            """
+            DELETE FROM lists WHERE item_id NOT IN (
+                SELECT MIN(item_id) FROM lists GROUP BY group_id, item
+            )
+            """,
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_lists_group_item ON lists(group_id, item)",
+        ],
+    ),
+    (
+        4,
+        "Outbox для исходящих уведомлений",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS outbox (
+                outbox_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER NOT NULL,
+                group_id INTEGER,
+                kind TEXT NOT NULL,
+                text TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                next_attempt_at REAL NOT NULL,
+                delivered_at REAL
+            )
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS idx_outbox_pending
+            ON outbox(next_attempt_at) WHERE status = 'pending'
+            """,
+        ],
+    ),
+    (
+        5,
+        "Данные событий outbox для сводных уведомлений",
+        [
+            add_column("outbox", "actor_name", "TEXT"),
+            add_column("outbox", "item", "TEXT"),
+        ],
+    ),
+    (
+        6,
+        "Живые сообщения со списком",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS live_messages (
+                chat_id INTEGER PRIMARY KEY,
+                message_id INTEGER NOT NULL,
+                menu_has_items INTEGER
+            )
+            """,
+        ],
+    ),
+    (
+        7,
+        "Версия списка группы для кэша отрисовки",
+        [add_column("groups", "version", "INTEGER NOT NULL DEFAULT 0")],
+    ),
+    (
+        8,
+        "Текущая страница живого сообщения",
+        [add_column("live_messages", "page", "INTEGER NOT NULL DEFAULT 0")],
+    ),
+    (
+        9,
+        "Состояния диалогов с временем жизни",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS states (
+                key TEXT PRIMARY KEY,
+                state TEXT,
+                data TEXT NOT NULL DEFAULT '{}',
+                expires_at REAL NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_states_expires_at ON states(expires_at)",
+        ],
+    ),
+    (
+        10,
+        "Счетчик изменений членства для кэшей нескольких процессов",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            )
+            """,
+            "INSERT OR IGNORE INTO counters (name, value) VALUES ('membership', 0)",
+        ],
+    ),
+    (
+        11,
+        "Время выдачи кода приглашения",
+        [
+            add_column("groups", "share_code_created_at", "REAL"),
+            # Уже выданные коды отсчитывают срок жизни с момента обновления
+            """
+            UPDATE groups SET share_code_created_at = CAST(strftime('%s', 'now') AS REAL)
+            WHERE share_code IS NOT NULL
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS idx_groups_share_code_created_at
+            ON groups(share_code_created_at) WHERE share_code_created_at IS NOT NULL
+            """,
+        ],
+    ),
+    (
+        12,
+        "История товаров группы для подсказок",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS item_history (
+                history_id INTEGER PRIMARY KEY,
+                group_id INTEGER NOT NULL,
+                norm TEXT NOT NULL,
+                item TEXT NOT NULL,
+                freq INTEGER NOT NULL DEFAULT 1,
+                last_used REAL NOT NULL,
+                UNIQUE (group_id, norm)
+            )
+            """,
+            """
+            CREATE INDEX IF NOT EXISTS idx_item_history_last_used
+            ON item_history(group_id, last_used)
+            """,
+            backfill_item_history,
+        ],
+    ),
+    (
+        13,
+        "Индекс недоставленных уведомлений группы для отмены",
+        [
+            """
+            CREATE INDEX IF NOT EXISTS idx_outbox_pending_group
+            ON outbox(group_id, kind) WHERE status = 'pending'
+            """,
+        ],
+    ),
+]
+
+
+def current_version():
+    """Возвращает номер последней примененной миграции."""
+    return execute_query(
+        "SELECT COALESCE(MAX(version), 0) FROM schema_version", fetchone=True
+    )[0]
+
+
+# Применение недостающих миграций при запуске
+def migrate():
+    """Обновляет схему базы данных до последней версии."""
+    execute_query(
+        """
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """
+    )
+    for version, description, statements in MIGRATIONS:
+        if version <= current_version():
+            continue
+        with transaction():
+            # Повторная проверка под блокировкой: миграцию мог применить другой процесс
+            if version <= current_version():
+                continue
+            for statement in statements:
+                if callable(statement):
+                    statement()
+                else:
+                    execute_query(statement)
+            execute_query(
+                "INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                (version, description),
+            )
+        logger.info(f"Применена миграция {version}: {description}")
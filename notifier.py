@@ -0,0 +1,276 @@
+# notifier.py
+
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+import telebot
+
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+# Одно сообщение, ожидающее отправки
+class Delivery:
+    __slots__ = ("chat_id", "text", "on_done", "max_attempts", "attempts", "created")
+
+    def __init__(self, chat_id, text, on_done=None, max_attempts=1):
+        self.chat_id = chat_id
+        self.text = text
+        self.on_done = on_done
+        self.max_attempts = max_attempts
+        self.attempts = 0
+        self.created = time.monotonic()
+
+
+def is_permanent_error(error):
+    """Ошибки, которые не исчезнут при повторной отправке (бот заблокирован и т.п.)."""
+    return (
+        isinstance(error, telebot.apihelper.ApiTelegramException)
+        and error.error_code != 429
+        and error.error_code < 500
+    )
+
+
+def retry_after(error):
+    """Сколько секунд Telegram просит подождать после ответа 429, иначе None."""
+    if (
+        isinstance(error, telebot.apihelper.ApiTelegramException)
+        and error.error_code == 429
+    ):
+        return ((error.result_json or {}).get("parameters") or {}).get("retry_after", 1)
+    return None
+
+
+# Фоновая рассылка уведомлений с ограничением скорости
+class Notifier:
+    """Рассылает сообщения пулом потоков, соблюдая лимиты Telegram.
+
+    Общий лимит (около 30 сообщений в секунду) обеспечивает ведро токенов,
+    лимит на один чат - минимальный интервал между сообщениями в него.
+    На ответ 429 сообщение откладывается на retry_after секунд, на сетевые
+    ошибки и ошибки 5xx - с экспоненциальной задержкой.
+    """
+
+    def __init__(
+        self,
+        send,
+        workers=4,
+        global_rate=30,
+        per_chat_interval=1.0,
+        max_retries=8,
+        base_backoff=1.0,
+    ):
+        self._send = send
+        self.workers = workers
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self._bucket = TokenBucket(global_rate, capacity=1)
+        # Очередь с приоритетом по времени готовности: (ready_at, seq, delivery)
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        # Когда в чат снова можно отправлять: chat_id -> monotonic time
+        self._chat_ready = {}
+        self._threads = []
+        self._running = False
+        self._in_flight = 0
+        self._latencies = deque(maxlen=1000)
+        self.submitted = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            for i in range(self.workers):
+                thread = threading.Thread(
+                    target=self._worker, name=f"notifier-{i}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, chat_id, text, on_done=None, attempts=None):
+        """Ставит сообщение в очередь и сразу возвращает управление.
+
+        attempts - сколько раз пытаться отправить (по умолчанию max_retries).
+        Кто сам повторяет доставку, передает 1: тогда сообщение не задержится
+        в очереди дольше, чем ждет своей очереди на отправку.
+        """
+        if not self._running:
+            self.start()
+        delivery = Delivery(chat_id, text, on_done, attempts or self.max_retries)
+        with self._cond:
+            self.submitted += 1
+            self._push(time.monotonic(), delivery)
+
+    def _push(self, ready_at, delivery):
+        heapq.heappush(self._heap, (ready_at, next(self._seq), delivery))
+        # Будим всех: на условии ждут и рабочие потоки, и join()
+        self._cond.notify_all()
+
+    def _next(self):
+        """Ждет следующее сообщение, которое уже можно отправить."""
+        with self._cond:
+            while True:
+                if not self._heap:
+                    if not self._running:
+                        return None
+                    self._cond.wait()
+                    continue
+                now = time.monotonic()
+                ready_at, _, delivery = self._heap[0]
+                if ready_at > now:
+                    self._cond.wait(ready_at - now)
+                    continue
+                heapq.heappop(self._heap)
+                chat_ready = self._chat_ready.get(delivery.chat_id, 0)
+                if chat_ready > now:
+                    # В этот чат писали недавно, откладываем до освобождения
+                    self._push(chat_ready, delivery)
+                    continue
+                # Место в общем лимите резервируем сразу, чтобы интервал до
+                # следующего сообщения в чат отсчитывался от реальной отправки
+                delay = self._bucket.reserve()
+                self._chat_ready[delivery.chat_id] = (
+                    now + delay + self.per_chat_interval
+                )
+                if len(self._chat_ready) > 10000:
+                    self._chat_ready = {
+                        chat_id: t for chat_id, t in self._chat_ready.items() if t > now
+                    }
+                self._in_flight += 1
+                return delivery, delay
+
+    def _worker(self):
+        while True:
+            task = self._next()
+            if task is None:
+                return
+            try:
+                self._deliver(*task)
+            finally:
+                with self._cond:
+                    self._in_flight -= 1
+                    self._cond.notify_all()
+
+    def _deliver(self, delivery, delay):
+        if delay:
+            time.sleep(delay)
+        delivery.attempts += 1
+        try:
+            self._send(delivery.chat_id, delivery.text)
+        except telebot.apihelper.ApiTelegramException as e:
+            if e.error_code == 429:
+                self._retry(delivery, e, retry_after(e))
+            elif e.error_code >= 500:
+                self._retry(delivery, e)
+            else:
+                if e.error_code == 403:
+                    logger.error(
+                        f"Не могу отправить сообщение пользователю {delivery.chat_id}: {e.description}"
+                    )
+                else:
+                    logger.error(
+                        f"Ошибка отправки сообщения пользователю {delivery.chat_id}: {e.description}"
+                    )
+                self._finish(delivery, e)
+        except requests.exceptions.RequestException as e:
+            self._retry(delivery, e)
+        except Exception as e:
+            logger.exception(
+                f"Ошибка отправки сообщения пользователю {delivery.chat_id}: {e}"
+            )
+            self._finish(delivery, e)
+        else:
+            self._finish(delivery, None)
+
+    def _retry(self, delivery, error, delay=None):
+        now = time.monotonic()
+        if delivery.attempts >= delivery.max_attempts:
+            if delay is not None:
+                # Лимит чата соблюдаем и для сообщений, которые повторит вызывающий
+                with self._cond:
+                    self._delay_chat(delivery.chat_id, now + delay)
+            if delivery.max_attempts > 1:
+                logger.error(
+                    f"Сообщение пользователю {delivery.chat_id} не доставлено после "
+                    f"{delivery.attempts} попыток: {error}"
+                )
+            self._finish(delivery, error)
+            return
+        if delay is None:
+            delay = self.base_backoff * 2 ** (delivery.attempts - 1)
+            delay *= random.uniform(0.8, 1.2)
+        with self._cond:
+            self.retried += 1
+            self._delay_chat(delivery.chat_id, now + delay)
+            self._push(now + delay, delivery)
+
+    def _delay_chat(self, chat_id, ready_at):
+        self._chat_ready[chat_id] = max(self._chat_ready.get(chat_id, 0), ready_at)
+
+    def _finish(self, delivery, error):
+        with self._cond:
+            if error is None:
+                self.sent += 1
+                self._latencies.append(time.monotonic() - delivery.created)
+            else:
+                self.failed += 1
+        if delivery.on_done:
+            try:
+                delivery.on_done(error is None, error)
+            except Exception:
+                logger.exception("Ошибка в обработчике результата отправки")
+
+    def queue_depth(self):
+        with self._cond:
+            return len(self._heap) + self._in_flight
+
+    def join(self, timeout=None):
+        """Ждет, пока очередь опустеет. Возвращает False по истечении timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._heap or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stop(self, timeout=None):
+        """Дожидается отправки очереди (не дольше timeout) и останавливает потоки."""
+        self.join(timeout)
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def stats(self):
+        with self._cond:
+            latencies = sorted(self._latencies)
+            stats = {
+                "queue_depth": len(self._heap) + self._in_flight,
+                "submitted": self.submitted,
+                "sent": self.sent,
+                "failed": self.failed,
+                "retried": self.retried,
+            }
+        if latencies:
+            stats["latency_avg"] = sum(latencies) / len(latencies)
+            stats["latency_p50"] = latencies[len(latencies) // 2]
+            stats["latency_p95"] = latencies[int(len(latencies) * 0.95)]
+            stats["latency_max"] = latencies[-1]
+        return stats
@@ -0,0 +1,316 @@
+# outbox.py
+
+import functools
+import logging
+import threading
+import time
+from collections import namedtuple
+
+from db import execute_many, execute_query, transaction
+from notifier import is_permanent_error, retry_after
+from settings import (
+    NOTIFY_DIGEST_MAX_WAIT,
+    NOTIFY_DIGEST_WINDOW,
+    OUTBOX_BATCH_SIZE,
+    OUTBOX_LEASE,
+    OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_MAX_BACKOFF,
+    OUTBOX_MAX_QUEUED,
+    OUTBOX_POLL_INTERVAL,
+    OUTBOX_RETENTION,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# Событие из outbox, передаваемое в функцию отрисовки уведомления
+Event = namedtuple("Event", "kind text actor_name item")
+
+
+# Запись уведомлений для участников группы
+def enqueue_many(group_id, kind, events, exclude_user_id=None, actor_name=None):
+    """Добавляет в outbox события [(текст, товар), ...] каждому участнику группы.
+
+    Вызывается в той же транзакции, что и изменение списка, поэтому
+    уведомления сохраняются только вместе с самим изменением. kind,
+    actor_name и товары нужны, чтобы объединять события в сводку.
+    """
+    now = time.time()
+    execute_many(
+        """
+        INSERT INTO outbox (
+            chat_id, group_id, kind, text, actor_name, item, created_at, next_attempt_at
+        )
+        SELECT user_id, group_id, ?, ?, ?, ?, ?, ? FROM user_groups
+        WHERE group_id = ? AND user_id IS NOT ?
+    """,
+        [
+            (kind, text, actor_name, item, now, now, group_id, exclude_user_id)
+            for text, item in events
+        ],
+    )
+
+
+def cancel(group_id, kinds):
+    """Удаляет еще не отправленные события группы указанных типов."""
+    placeholders = ",".join("?" * len(kinds))
+    execute_query(
+        f"""
+        DELETE FROM outbox
+        WHERE group_id = ? AND status = 'pending' AND kind IN ({placeholders})
+    """,
+        (group_id, *kinds),
+    )
+
+
+def render_plain(events):
+    """Отрисовка по умолчанию: тексты событий подряд."""
+    return "\n\n".join(event.text for event in events)
+
+
+def backlog():
+    """Количество недоставленных уведомлений и возраст самого старого (в секундах)."""
+    count, oldest = execute_query(
+        "SELECT COUNT(*), MIN(created_at) FROM outbox WHERE status = 'pending'",
+        fetchone=True,
+    )
+    return {
+        "pending": count,
+        "oldest_age": time.time() - oldest if oldest is not None else 0.0,
+    }
+
+
+# Фоновый цикл доставки уведомлений из outbox
+class OutboxSender:
+    """Забирает готовые к отправке строки outbox и передает их в Notifier.
+
+    Все накопившиеся события одного получателя отправляются одним сообщением,
+    которое собирает функция render. Получатель считается готовым, когда
+    после его последнего события прошло digest_window секунд или первое
+    событие ждет дольше digest_max_wait. Строка резервируется на OUTBOX_LEASE секунд; если процесс упадет до
+    подтверждения, она снова станет доступной, поэтому доставка выполняется
+    как минимум один раз. После неудачи следующая попытка откладывается
+    с экспоненциальной задержкой.
+
+    Notifier делает одну попытку, повторы планирует outbox, а новые строки
+    резервируются, только пока в очереди notifier меньше max_queued
+    сообщений. Поэтому сообщение не лежит в памяти дольше резерва и не
+    уходит дважды из-за того, что резерв истек в очереди.
+    """
+
+    def __init__(
+        self,
+        notifier,
+        render=render_plain,
+        digest_window=NOTIFY_DIGEST_WINDOW,
+        digest_max_wait=NOTIFY_DIGEST_MAX_WAIT,
+        poll_interval=OUTBOX_POLL_INTERVAL,
+        batch_size=OUTBOX_BATCH_SIZE,
+        max_queued=OUTBOX_MAX_QUEUED,
+        lease=OUTBOX_LEASE,
+        max_attempts=OUTBOX_MAX_ATTEMPTS,
+        max_backoff=OUTBOX_MAX_BACKOFF,
+        retention=OUTBOX_RETENTION,
+    ):
+        self.notifier = notifier
+        self.render = render
+        self.digest_window = digest_window
+        self.digest_max_wait = digest_max_wait
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.max_queued = max_queued
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+        self.retention = retention
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._running = False
+        self._last_purge = 0.0
+        # Запускать ли доставку при первом wake(). Рабочие процессы
+        # dispatcher.py только пишут в outbox, доставляет главный процесс
+        self.autostart = True
+        self.claimed = 0
+        self.messages = 0
+        self.sent = 0
+        self.failed = 0
+        self.rescheduled = 0
+
+    def start(self):
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(
+                target=self._run, name="outbox-sender", daemon=True
+            )
+            self._thread.start()
+
+    def wake(self):
+        """Сообщает, что в outbox появились новые строки."""
+        if not self._running:
+            if not self.autostart:
+                return
+            self.start()
+        self._wake.set()
+
+    def stop(self, timeout=None):
+        self._running = False
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while self._running:
+            claimed = 0
+            try:
+                claimed = self.drain_once()
+                if time.time() - self._last_purge > 60:
+                    self.purge()
+            except Exception:
+                logger.exception("Ошибка при разборе outbox")
+            if claimed < self.batch_size:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def drain_once(self):
+        """Резервирует события готовых получателей и ставит сводки в очередь отправки.
+
+        Возвращает количество получателей.
+        """
+        # Очередь notifier и так полна: ждем, пока она разойдется
+        limit = min(self.batch_size, self.max_queued - self.notifier.queue_depth())
+        if limit <= 0:
+            return 0
+        now = time.time()
+        # Поиск готовых получателей без блокировки на запись
+        chats = execute_query(
+            """
+            SELECT chat_id FROM outbox
+            WHERE status = 'pending' AND next_attempt_at <= ?
+            GROUP BY chat_id
+            HAVING MAX(created_at) <= ? OR MIN(created_at) <= ?
+            LIMIT ?
+        """,
+            (
+                now,
+                now - self.digest_window,
+                now - self.digest_max_wait,
+                limit,
+            ),
+            fetch=True,
+        )
+        if not chats:
+            return 0
+        chat_ids = [row[0] for row in chats]
+        with transaction():
+            rows = execute_query(
+                f"""
+                SELECT outbox_id, chat_id, kind, text, actor_name, item FROM outbox
+                WHERE status = 'pending' AND next_attempt_at <= ?
+                    AND chat_id IN ({",".join("?" * len(chat_ids))})
+                ORDER BY outbox_id
+            """,
+                (now, *chat_ids),
+                fetch=True,
+            )
+            if rows:
+                execute_query(
+                    f"""
+                    UPDATE outbox SET next_attempt_at = ?
+                    WHERE outbox_id IN ({",".join("?" * len(rows))})
+                """,
+                    (now + self.lease, *(row[0] for row in rows)),
+                )
+
+        # События каждого получателя в порядке появления
+        batches = {}
+        for outbox_id, chat_id, *event in rows:
+            ids, events = batches.setdefault(chat_id, ([], []))
+            ids.append(outbox_id)
+            events.append(Event(*event))
+        with self._lock:
+            self.claimed += len(rows)
+            self.messages += len(batches)
+        for chat_id, (ids, events) in batches.items():
+            try:
+                text = self.render(events)
+            except Exception:
+                logger.exception("Ошибка при подготовке сводки уведомлений")
+                text = render_plain(events)
+            self.notifier.submit(
+                chat_id, text, on_done=functools.partial(self._on_done, ids), attempts=1
+            )
+        return len(batches)
+
+    def _on_done(self, outbox_ids, delivered, error):
+        now = time.time()
+        placeholders = ",".join("?" * len(outbox_ids))
+        if delivered:
+            execute_query(
+                f"""
+                UPDATE outbox SET status = 'sent', attempts = attempts + 1,
+                    delivered_at = ?
+                WHERE outbox_id IN ({placeholders})
+            """,
+                (now, *outbox_ids),
+            )
+            with self._lock:
+                self.sent += len(outbox_ids)
+        elif is_permanent_error(error):
+            execute_query(
+                f"""
+                UPDATE outbox SET status = 'failed', attempts = attempts + 1
+                WHERE outbox_id IN ({placeholders})
+            """,
+                outbox_ids,
+            )
+            with self._lock:
+                self.failed += len(outbox_ids)
+        else:
+            # На ответ 429 ждем не меньше, чем просит Telegram
+            execute_query(
+                f"""
+                UPDATE outbox SET
+                    attempts = attempts + 1,
+                    status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END,
+                    next_attempt_at = ? + MAX(?, MIN(?, 1 << attempts))
+                WHERE outbox_id IN ({placeholders})
+            """,
+                (
+                    self.max_attempts,
+                    now,
+                    retry_after(error) or 0,
+                    self.max_backoff,
+                    *outbox_ids,
+                ),
+            )
+            with self._lock:
+                self.rescheduled += len(outbox_ids)
+
+    def purge(self, batch=500):
+        """Удаляет обработанные строки старше срока хранения небольшими порциями."""
+        self._last_purge = time.time()
+        execute_query(
+            """
+            DELETE FROM outbox WHERE outbox_id IN (
+                SELECT outbox_id FROM outbox
+                WHERE status != 'pending' AND created_at < ? LIMIT ?
+            )
+        """,
+            (self._last_purge - self.retention, batch),
+        )
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "claimed": self.claimed,
+                "messages": self.messages,
+                "sent": self.sent,
+                "failed": self.failed,
+                "rescheduled": self.rescheduled,
+            }
+        stats.update(backlog())
+        return stats
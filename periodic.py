@@ -0,0 +1,38 @@
+# periodic.py
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+# Фоновая задача, которая выполняется через равные промежутки времени
+class PeriodicTask:
+    """Вызывает func каждые interval секунд в отдельном потоке."""
+
+    def __init__(self, name, func, interval):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None or not self.interval:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.func()
+            except Exception:
+                logger.exception(f"Ошибка в фоновой задаче {self.name}")
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
@@ -0,0 +1,85 @@
+# ratelimit.py
+
+import threading
+import time
+
+from cache import LRUCache
+
+
+# Ведро токенов для ограничения частоты действий
+class TokenBucket:
+    """Пополняется со скоростью rate токенов в секунду, вмещает не больше capacity."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens=1):
+        """Забирает токены, если они есть. Возвращает False, если ведро пусто."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+    def reserve(self, tokens=1):
+        """Забирает токены в долг и возвращает, сколько секунд нужно подождать."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= tokens
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+
+# Ограничение частоты обновлений от пользователей и групп
+class FloodControl:
+    """Держит ведро токенов на каждого пользователя и каждую группу.
+
+    Ведра хранятся в LRU-кэшах на max_tracked записей, так что давно
+    молчавшие отправители забываются и снова начинают с полного ведра.
+    Лимит со скоростью None не проверяется.
+    """
+
+    def __init__(
+        self, user_rate, user_burst, group_rate, group_burst, max_tracked=10000
+    ):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self._users = LRUCache(max_tracked)
+        self._groups = LRUCache(max_tracked)
+
+    @staticmethod
+    def _acquire(buckets, key, rate, burst):
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(rate, burst)
+            buckets.put(key, bucket)
+        return bucket.try_acquire()
+
+    def check(self, user_id, group_id=None):
+        """Возвращает None, если обновление можно обработать, иначе
+        "user" или "group" - чей лимит превышен."""
+        if self.user_rate and not self._acquire(
+            self._users, user_id, self.user_rate, self.user_burst
+        ):
+            return "user"
+        if (
+            self.group_rate
+            and group_id is not None
+            and not self._acquire(
+                self._groups, group_id, self.group_rate, self.group_burst
+            )
+        ):
+            return "group"
+        return None
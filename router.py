@@ -0,0 +1,102 @@
+# router.py
+"""Таблица маршрутов для сообщений и нажатий на кнопки.
+
+Вместо цепочки фильтров, которые проверяются по очереди для каждого
+обновления, обработчик находится одним поиском в словаре: для сообщений -
+по тексту кнопки меню, для кнопок - по действию из callback_data.
+
+Данные кнопок имеют вид "действие:параметр" ("delete:15", "page:2") или
+просто "действие" ("add"). Кнопки в уже отправленных сообщениях используют
+старый формат ("delete_15", "add_yes"), он тоже распознается.
+"""
+
+import threading
+from collections import Counter
+
+# Данные кнопок старого формата без параметра
+LEGACY_CALLBACKS = {
+    "add_yes": ("add", ""),
+    "confirm_clear": ("clear", ""),
+}
+
+
+# Данные для кнопки
+def callback_data(action, payload=None):
+    return action if payload is None else f"{action}:{payload}"
+
+
+# Разбор данных кнопки
+def parse_callback(data):
+    """Возвращает (действие, параметр) для нового и старого формата."""
+    action, separator, payload = (data or "").partition(":")
+    if separator:
+        return action, payload
+    if action in LEGACY_CALLBACKS:
+        return LEGACY_CALLBACKS[action]
+    # "delete_15" -> ("delete", "15"), "cancel" -> ("cancel", "")
+    action, _, payload = action.partition("_")
+    return action, payload
+
+
+class Router:
+    """Находит обработчик обновления и считает обращения к каждому маршруту."""
+
+    def __init__(self):
+        self.texts = {}
+        self.actions = {}
+        self.fallback = None
+        self.hits = Counter()
+        self._lock = threading.Lock()
+
+    def text(self, *texts):
+        """Декоратор: обработчик сообщений с одним из указанных текстов."""
+
+        def register(handler):
+            for text in texts:
+                self.texts[text] = handler
+            return handler
+
+        return register
+
+    def default(self, handler):
+        """Декоратор: обработчик остальных текстовых сообщений."""
+        self.fallback = handler
+        return handler
+
+    def action(self, *actions):
+        """Декоратор: обработчик кнопок handler(call, payload) с указанными действиями."""
+
+        def register(handler):
+            for action in actions:
+                self.actions[action] = handler
+            return handler
+
+        return register
+
+    def _hit(self, route):
+        with self._lock:
+            self.hits[route] += 1
+
+    def message_route(self, message):
+        """Возвращает обработчик сообщения или None, если в нем нет текста."""
+        if message.text is None:
+            self._hit("message:<no text>")
+            return None
+        handler = self.texts.get(message.text, self.fallback)
+        if handler is not None:
+            self._hit(f"message:{handler.__name__}")
+        return handler
+
+    def callback_route(self, call):
+        """Возвращает (обработчик, параметр) для нажатия или (None, None)."""
+        action, payload = parse_callback(call.data)
+        handler = self.actions.get(action)
+        if handler is None:
+            self._hit("callback:<unknown>")
+            return None, None
+        self._hit(f"callback:{action}")
+        return handler, payload
+
+    def stats(self):
+        with self._lock:
+            return dict(self.hits)
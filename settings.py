@@ -0,0 +1,137 @@
+# settings.py
+
+# Необязательные параметры со значениями по умолчанию.
+# Любой из них можно переопределить, добавив одноименную переменную в config.py.
+import config
+
+# Размер кэша страниц SQLite на одно соединение (в КиБ)
+DB_CACHE_SIZE_KB = getattr(config, "DB_CACHE_SIZE_KB", 16384)
+# Сколько подготовленных выражений кэшировать на одно соединение
+DB_STATEMENT_CACHE_SIZE = getattr(config, "DB_STATEMENT_CACHE_SIZE", 256)
+# Сколько секунд ждать снятия блокировки базы данных
+DB_BUSY_TIMEOUT = getattr(config, "DB_BUSY_TIMEOUT", 5.0)
+
+# Сколько потоков выполняют запросы к базе в асинхронном режиме
+# (python main.py --async). Записи SQLite все равно идут по одной, а
+# чтения в режиме WAL выполняются параллельно
+DB_EXECUTOR_WORKERS = getattr(config, "DB_EXECUTOR_WORKERS", 4)
+
+# Адрес Bot API в формате apihelper.API_URL, например локальный тестовый сервер:
+# "http://127.0.0.1:8081/bot{0}/{1}". None - официальный api.telegram.org
+TELEGRAM_API_URL = getattr(config, "TELEGRAM_API_URL", None)
+
+# Рассылка уведомлений: число потоков, общий лимит сообщений в секунду,
+# минимальный интервал между сообщениями в один чат и число попыток
+NOTIFY_WORKERS = getattr(config, "NOTIFY_WORKERS", 4)
+NOTIFY_GLOBAL_RATE = getattr(config, "NOTIFY_GLOBAL_RATE", 30)
+NOTIFY_PER_CHAT_INTERVAL = getattr(config, "NOTIFY_PER_CHAT_INTERVAL", 1.0)
+NOTIFY_MAX_RETRIES = getattr(config, "NOTIFY_MAX_RETRIES", 8)
+
+# Outbox уведомлений: как часто проверять таблицу (сек), сколько строк брать
+# за раз, на сколько секунд строка резервируется за отправителем, число попыток
+# доставки, предельная задержка между попытками и срок хранения доставленных строк.
+# Новые сообщения не резервируются, пока в очереди notifier их не меньше
+# OUTBOX_MAX_QUEUED: при NOTIFY_GLOBAL_RATE в секунду очередь отправляется
+# за секунды, что намного меньше OUTBOX_LEASE
+OUTBOX_POLL_INTERVAL = getattr(config, "OUTBOX_POLL_INTERVAL", 1.0)
+OUTBOX_BATCH_SIZE = getattr(config, "OUTBOX_BATCH_SIZE", 100)
+OUTBOX_MAX_QUEUED = getattr(config, "OUTBOX_MAX_QUEUED", 200)
+OUTBOX_LEASE = getattr(config, "OUTBOX_LEASE", 300)
+OUTBOX_MAX_ATTEMPTS = getattr(config, "OUTBOX_MAX_ATTEMPTS", 10)
+OUTBOX_MAX_BACKOFF = getattr(config, "OUTBOX_MAX_BACKOFF", 3600)
+OUTBOX_RETENTION = getattr(config, "OUTBOX_RETENTION", 86400)
+
+# Сводные уведомления: события одной группы для одного получателя копятся,
+# пока не наступит пауза NOTIFY_DIGEST_WINDOW секунд (но не дольше
+# NOTIFY_DIGEST_MAX_WAIT), и уходят одним сообщением. 0 - без ожидания
+NOTIFY_DIGEST_WINDOW = getattr(config, "NOTIFY_DIGEST_WINDOW", 3.0)
+NOTIFY_DIGEST_MAX_WAIT = getattr(config, "NOTIFY_DIGEST_MAX_WAIT", 30.0)
+
+# Сколько отрисованных списков (текст и кнопки) хранить в памяти
+RENDER_CACHE_SIZE = getattr(config, "RENDER_CACHE_SIZE", 1024)
+
+# Сколько записей хранить в кэшах членства (пользователь -> группа
+# и группа -> участники)
+MEMBERSHIP_CACHE_SIZE = getattr(config, "MEMBERSHIP_CACHE_SIZE", 10000)
+
+# Сколько товаров показывать на одной странице списка и до скольких символов
+# укорачивать название товара в тексте. Страница должна укладываться в лимиты
+# Telegram: 100 кнопок и 4096 символов с учетом экранирования Markdown
+LIST_PAGE_SIZE = getattr(config, "LIST_PAGE_SIZE", 20)
+LIST_ITEM_DISPLAY_LENGTH = getattr(config, "LIST_ITEM_DISPLAY_LENGTH", 80)
+
+# Сколько товаров можно добавить одним сообщением
+MAX_ITEMS_PER_MESSAGE = getattr(config, "MAX_ITEMS_PER_MESSAGE", 50)
+
+# Сколько товаров из истории группы предлагать кнопками при добавлении и за
+# сколько секунд кнопка повтора возвращает в список добавленные ранее товары
+ITEM_SUGGESTIONS = getattr(config, "ITEM_SUGGESTIONS", 5)
+REPEAT_PERIOD = getattr(config, "REPEAT_PERIOD", 7 * 86400)
+
+# Сколько секунд хранится состояние диалога (например, ожидание товара или
+# кода приглашения) с последнего изменения и как часто удалять просроченные
+STATE_TTL = getattr(config, "STATE_TTL", 86400)
+STATE_SWEEP_INTERVAL = getattr(config, "STATE_SWEEP_INTERVAL", 600)
+
+# Сколько секунд действует код приглашения (None - бессрочно). Фоновая уборка
+# раз в GC_INTERVAL секунд стирает просроченные коды, удаляет группы без
+# участников порциями по GC_BATCH_SIZE и возвращает файлу базы до
+# GC_VACUUM_PAGES свободных страниц
+SHARE_CODE_TTL = getattr(config, "SHARE_CODE_TTL", 7 * 86400)
+GC_INTERVAL = getattr(config, "GC_INTERVAL", 3600)
+GC_BATCH_SIZE = getattr(config, "GC_BATCH_SIZE", 200)
+GC_VACUUM_PAGES = getattr(config, "GC_VACUUM_PAGES", 1000)
+
+# Ограничение частоты обновлений: сколько обновлений в секунду в среднем и
+# сколько подряд можно прислать одному пользователю и всей группе. Лишние
+# обновления отбрасываются. Скорость None отключает соответствующий лимит.
+# FLOOD_MAX_TRACKED - сколько отправителей помнить
+FLOOD_USER_RATE = getattr(config, "FLOOD_USER_RATE", 1.0)
+FLOOD_USER_BURST = getattr(config, "FLOOD_USER_BURST", 10)
+FLOOD_GROUP_RATE = getattr(config, "FLOOD_GROUP_RATE", 3.0)
+FLOOD_GROUP_BURST = getattr(config, "FLOOD_GROUP_BURST", 30)
+FLOOD_MAX_TRACKED = getattr(config, "FLOOD_MAX_TRACKED", 10000)
+
+# Резервные копии (python backup.py). Если задан BACKUP_DIR, бот раз в
+# BACKUP_INTERVAL секунд сохраняет туда копию базы и хранит BACKUP_KEEP
+# последних (не меньше одной). Копирование идет порциями по BACKUP_PAGES
+# страниц; если база меняется так часто, что копирование начинается заново
+# больше BACKUP_MAX_RESTARTS раз, остаток копируется сразу
+BACKUP_DIR = getattr(config, "BACKUP_DIR", None)
+BACKUP_INTERVAL = getattr(config, "BACKUP_INTERVAL", 86400)
+BACKUP_KEEP = getattr(config, "BACKUP_KEEP", 7)
+BACKUP_PAGES = getattr(config, "BACKUP_PAGES", 256)
+BACKUP_MAX_RESTARTS = getattr(config, "BACKUP_MAX_RESTARTS", 3)
+
+# Режим webhook (python main.py --webhook). WEBHOOK_URL - внешний адрес,
+# который регистрируется в Telegram при запуске; если он не задан, webhook
+# нужно настроить вручную. WEBHOOK_SECRET сверяется с заголовком
+# X-Telegram-Bot-Api-Secret-Token каждого запроса; без него бот в режиме
+# webhook не запустится, если только не задан WEBHOOK_URL (тогда секрет
+# генерируется при каждом запуске)
+WEBHOOK_HOST = getattr(config, "WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = getattr(config, "WEBHOOK_PORT", 8443)
+WEBHOOK_PATH = getattr(config, "WEBHOOK_PATH", "/webhook")
+WEBHOOK_URL = getattr(config, "WEBHOOK_URL", None)
+WEBHOOK_SECRET = getattr(config, "WEBHOOK_SECRET", None)
+
+# Сколько потоков обрабатывают обновления в режиме webhook и сколько
+# обновлений может ждать в очереди каждого потока
+WEBHOOK_WORKERS = getattr(config, "WEBHOOK_WORKERS", 8)
+WEBHOOK_QUEUE_SIZE = getattr(config, "WEBHOOK_QUEUE_SIZE", 1000)
+
+# Сколько процессов обрабатывают обновления (python main.py --workers N).
+# При значении больше 1 главный процесс раздает обновления рабочим так, что
+# обновления одной группы обрабатываются по порядку в одном процессе.
+# DISPATCH_QUEUE_SIZE - сколько обновлений может ждать каждый процесс
+WORKER_PROCESSES = getattr(config, "WORKER_PROCESSES", 1)
+DISPATCH_QUEUE_SIZE = getattr(config, "DISPATCH_QUEUE_SIZE", 1000)
+
+# Метрики в формате Prometheus: при заданном METRICS_PORT они доступны по
+# адресу http://METRICS_HOST:METRICS_PORT/metrics. Рабочие процессы
+# (--workers) отдают свои метрики на следующих портах: METRICS_PORT + 1 и т.д.
+METRICS_HOST = getattr(config, "METRICS_HOST", "127.0.0.1")
+METRICS_PORT = getattr(config, "METRICS_PORT", None)
+
+# SQL-запросы дольше этого числа секунд попадают в лог. None - не логировать
+SLOW_QUERY_THRESHOLD = getattr(config, "SLOW_QUERY_THRESHOLD", 0.1)
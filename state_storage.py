@@ -0,0 +1,260 @@
+# state_storage.py
+
+import json
+import time
+
+from telebot import asyncio_storage
+from telebot.storage import StateStorageBase
+
+from db import execute_query, run_in_db, transaction
+
+
+# Контекст для "with bot.retrieve_data(...) as data": сохраняет данные при выходе
+class StateDataContext:
+    def __init__(self, storage, key):
+        self.storage = storage
+        self.key = key
+        self.data = storage._get_data(key)
+
+    def __enter__(self):
+        return self.data
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.storage._save(self.key, self.data)
+
+
+# Хранилище состояний диалога в SQLite
+class SQLiteStateStorage(StateStorageBase):
+    """Хранит состояния и данные пользователей в таблице states.
+
+    Состояния переживают перезапуск бота и доступны всем процессам, работающим
+    с той же базой. Каждая запись живет ttl секунд с последнего изменения,
+    просроченные записи не читаются и удаляются методом sweep().
+    """
+
+    def __init__(self, ttl):
+        super().__init__()
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(chat_id, user_id, business_connection_id, message_thread_id, bot_id):
+        parts = [bot_id, business_connection_id, message_thread_id, chat_id, user_id]
+        return ":".join(str(part) for part in parts if part is not None)
+
+    def _get_row(self, key):
+        return execute_query(
+            "SELECT state, data FROM states WHERE key = ? AND expires_at > ?",
+            (key, time.time()),
+            fetchone=True,
+        )
+
+    def _get_data(self, key):
+        row = self._get_row(key)
+        return json.loads(row[1]) if row else {}
+
+    def _save(self, key, data):
+        execute_query(
+            "UPDATE states SET data = ?, expires_at = ? WHERE key = ? AND expires_at > ?",
+            (json.dumps(data), time.time() + self.ttl, key, time.time()),
+        )
+        return True
+
+    def set_state(
+        self,
+        chat_id,
+        user_id,
+        state,
+        business_connection_id=None,
+        message_thread_id=None,
+        bot_id=None,
+    ):
+        if hasattr(state, "name"):
+            state = state.name
+        key = self._key(
+            chat_id, user_id, business_connection_id, message_thread_id, bot_id
+        )
+        now = time.time()
+        with transaction():
+            # Просроченная запись начинается заново, с пустыми данными
+            execute_query(
+                "DELETE FROM states WHERE key = ? AND expires_at <= ?", (key, now)
+            )
+            execute_query(
+                "INSERT OR IGNORE INTO states (key, state, data, expires_at) VALUES (?, ?, '{}', ?)",
+                (key, state, now + self.ttl),
+            )
+            execute_query(
+                "UPDATE states SET state = ?, expires_at = ? WHERE key = ?",
+                (state, now + self.ttl, key),
+            )
+        return True
+
+    def get_state(
+        self,
+        chat_id,
+        user_id,
+        business_connection_id=None,
+        message_thread_id=None,
+        bot_id=None,
+    ):
+        row = self._get_row(
+            self._key(
+                chat_id, user_id, business_connection_id, message_thread_id, bot_id
+            )
+        )
+        return row[0] if row else None
+
+    def delete_state(
+        self,
+        chat_id,
+        user_id,
+        business_connection_id=None,
+        message_thread_id=None,
+        bot_id=None,
+    ):
+        key = self._key(
+            chat_id, user_id, business_connection_id, message_thread_id, bot_id
+        )
+        with transaction():
+            exists = self._get_row(key)
+            execute_query("DELETE FROM states WHERE key = ?", (key,))
+        return bool(exists)
+
+    def set_data(
+        self,
+        chat_id,
+        user_id,
+        key,
+        value,
+        business_connection_id=None,
+        message_thread_id=None,
+        bot_id=None,
+    ):
+        state_key = self._key(
+            chat_id, user_id, business_connection_id, message_thread_id, bot_id
+        )
+        with transaction():
+            row = self._get_row(state_key)
+            if row is None:
+                raise RuntimeError(
+                    f"SQLiteStateStorage: key {state_key} does not exist."
+                )
+            data = json.loads(row[1])
+            data[key] = value
+            self._save(state_key, data)
+        return True
+
+    def get_data(
+        self,
+        chat_id,
+        user_id,
+        business_connection_id=None,
+        message_thread_id=None,
+        bot_id=None,
+    ):
+        return self._get_data(
+            self._key(
+                chat_id, user_id, business_connection_id, message_thread_id, bot_id
+            )
+        )
+
+    def reset_data(
+        self,
+        chat_id,
+        user_id,
+        business_connection_id=None,
+        message_thread_id=None,
+        bot_id=None,
+    ):
+        key = self._key(
+            chat_id, user_id, business_connection_id, message_thread_id, bot_id
+        )
+        with transaction():
+            if self._get_row(key) is None:
+                return False
+            return self._save(key, {})
+
+    def get_interactive_data(
+        self,
+        chat_id,
+        user_id,
+        business_connection_id=None,
+        message_thread_id=None,
+        bot_id=None,
+    ):
+        return StateDataContext(
+            self,
+            self._key(
+                chat_id, user_id, business_connection_id, message_thread_id, bot_id
+            ),
+        )
+
+    def save(
+        self,
+        chat_id,
+        user_id,
+        data,
+        business_connection_id=None,
+        message_thread_id=None,
+        bot_id=None,
+    ):
+        return self._save(
+            self._key(
+                chat_id, user_id, business_connection_id, message_thread_id, bot_id
+            ),
+            data,
+        )
+
+    def sweep(self, batch=500):
+        """Удаляет просроченные записи порциями. Возвращает число удаленных."""
+        removed = 0
+        while True:
+            deleted = execute_query(
+                """
+                DELETE FROM states WHERE key IN (
+                    SELECT key FROM states WHERE expires_at <= ? LIMIT ?
+                )
+            """,
+                (time.time(), batch),
+                rowcount=True,
+            )
+            removed += deleted
+            if deleted < batch:
+                return removed
+
+
+# То же хранилище для AsyncTeleBot: запросы выполняются в пуле потоков базы
+class AsyncSQLiteStateStorage(asyncio_storage.StateStorageBase):
+    def __init__(self, storage):
+        super().__init__()
+        self.storage = storage
+
+    async def set_state(self, chat_id, user_id, state, **kwargs):
+        return await run_in_db(
+            self.storage.set_state, chat_id, user_id, state, **kwargs
+        )
+
+    async def get_state(self, chat_id, user_id, **kwargs):
+        return await run_in_db(self.storage.get_state, chat_id, user_id, **kwargs)
+
+    async def delete_state(self, chat_id, user_id, **kwargs):
+        return await run_in_db(self.storage.delete_state, chat_id, user_id, **kwargs)
+
+    async def set_data(self, chat_id, user_id, key, value, **kwargs):
+        return await run_in_db(
+            self.storage.set_data, chat_id, user_id, key, value, **kwargs
+        )
+
+    async def get_data(self, chat_id, user_id, **kwargs):
+        return await run_in_db(self.storage.get_data, chat_id, user_id, **kwargs)
+
+    async def reset_data(self, chat_id, user_id, **kwargs):
+        return await run_in_db(self.storage.reset_data, chat_id, user_id, **kwargs)
+
+    def get_interactive_data(self, chat_id, user_id, **kwargs):
+        return asyncio_storage.StateDataContext(self, chat_id, user_id, **kwargs)
+
+    async def save(self, chat_id, user_id, data, *args, **kwargs):
+        return await run_in_db(
+            self.storage.save, chat_id, user_id, data, *args, **kwargs
+        )
@@ -0,0 +1,192 @@
+# webhook.py
+"""Прием обновлений Telegram через webhook встроенным HTTP-сервером.
+
+Сервер только проверяет секретный токен, разбирает JSON и кладет обновление
+в очередь, сразу отвечая 200. Обработкой занимается пул рабочих потоков.
+Обновления одного пользователя всегда попадают в одну очередь и
+обрабатываются по порядку, поэтому состояния диалога не перемешиваются.
+
+Проверить локально можно, отправив записанное обновление:
+    curl -X POST http://127.0.0.1:8443/webhook \\
+        -H "Content-Type: application/json" \\
+        -H "X-Telegram-Bot-Api-Secret-Token: <WEBHOOK_SECRET>" \\
+        -d @update.json
+"""
+
+import hmac
+import json
+import logging
+import queue
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telebot import types
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# Telegram не присылает обновления больше нескольких десятков килобайт
+MAX_BODY_SIZE = 1 << 20
+
+
+# Ключ, по которому обновление закрепляется за рабочим потоком
+def update_key(update):
+    """Возвращает id отправителя или чата обновления, иначе update_id."""
+    for key, value in update.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        for field in ("from", "user", "chat"):
+            if isinstance(value.get(field), dict) and "id" in value[field]:
+                return value[field]["id"]
+    return update.get("update_id", 0)
+
+
+class WebhookServer:
+    """HTTP-сервер webhook с пулом обработчиков обновлений.
+
+    process получает список обновлений: объекты telebot.types.Update или,
+    с decode=False, исходные словари JSON.
+    """
+
+    def __init__(
+        self,
+        process,
+        host="0.0.0.0",
+        port=8443,
+        path="/webhook",
+        secret_token=None,
+        workers=8,
+        queue_size=1000,
+        decode=True,
+    ):
+        if not secret_token:
+            # Без секрета любой, кто достучится до порта, пришлет поддельные
+            # обновления от имени любого пользователя
+            raise ValueError("Для webhook нужен secret_token")
+        self.process = process
+        self.decode = decode
+        self.path = path
+        self.secret_token = secret_token
+        self.received = 0
+        self.rejected = 0
+        self.overloaded = 0
+        self.processed = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self._queues = [queue.Queue(queue_size) for _ in range(max(1, workers))]
+        self._workers = []
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{self.path}"
+
+    def start(self):
+        for index, updates in enumerate(self._queues):
+            worker = threading.Thread(
+                target=self._work, args=(updates,), name=f"webhook-{index}"
+            )
+            worker.start()
+            self._workers.append(worker)
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="webhook-server", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Webhook слушает {self.address}")
+        return self
+
+    def serve_forever(self):
+        """Блокирует вызывающий поток до остановки сервера."""
+        self._thread.join()
+
+    def stop(self, timeout=None):
+        """Перестает принимать запросы и дорабатывает уже принятые."""
+        self._server.shutdown()
+        self._server.server_close()
+        for updates in self._queues:
+            updates.put(None)
+        for worker in self._workers:
+            worker.join(timeout)
+        self._workers = []
+
+    def submit(self, update):
+        """Ставит обновление в очередь. Возвращает False, если очередь полна."""
+        updates = self._queues[hash(update_key(update)) % len(self._queues)]
+        try:
+            updates.put_nowait(update)
+        except queue.Full:
+            with self._lock:
+                self.overloaded += 1
+            return False
+        with self._lock:
+            self.received += 1
+        return True
+
+    def _work(self, updates):
+        while True:
+            update = updates.get()
+            if update is None:
+                return
+            try:
+                self.process([types.Update.de_json(update) if self.decode else update])
+                with self._lock:
+                    self.processed += 1
+            except Exception:
+                with self._lock:
+                    self.failed += 1
+                logger.exception(
+                    f"Ошибка обработки обновления {update.get('update_id')}"
+                )
+
+    def _authorized(self, headers):
+        return hmac.compare_digest(
+            headers.get(SECRET_HEADER, "").encode(), self.secret_token.encode()
+        )
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, status):
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_POST(self):
+                if self.path != server.path:
+                    return self._reply(404)
+                if not server._authorized(self.headers):
+                    with server._lock:
+                        server.rejected += 1
+                    return self._reply(403)
+                length = int(self.headers.get("Content-Length") or 0)
+                if not 0 < length <= MAX_BODY_SIZE:
+                    return self._reply(413 if length else 400)
+                try:
+                    update = json.loads(self.rfile.read(length))
+                except ValueError:
+                    return self._reply(400)
+                if not isinstance(update, dict):
+                    return self._reply(400)
+                # При 503 Telegram повторит доставку позже
+                self._reply(200 if server.submit(update) else 503)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def stats(self):
+        with self._lock:
+            return {
+                "received": self.received,
+                "processed": self.processed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "overloaded": self.overloaded,
+                "queue_depth": sum(updates.qsize() for updates in self._queues),
+            }